@@ -1,11 +1,296 @@
+import os
+import time
+import threading
 import joblib
+import pandas as pd
 import numpy as np #when we give input to the model we need to first convert the intput to numpy array
-from config.paths import SAVED_MODEL_PATH
-from flask import Flask, render_template,request
+from config.paths import SAVED_MODEL_PATH, COMPILED_MODEL_PATH, CONFIG_PATH, PREPROCESSOR_PATH, MODEL_REGISTRY_DIR, DRIFT_REFERENCE_PATH
+from flask import Flask, render_template,request, jsonify, g, Response
+from src.micro_batcher import MicroBatcher
+from src.model_reloader import ServingModel
+from src.model_registry import ModelRegistry, UnknownModelError
+from src.prediction_cache import PredictionCache
+from src.drift_monitor import DriftMonitor, load_reference
+from src.serving_metrics import MetricsRegistry, BATCH_SIZE_BUCKETS
+from src.fast_predictor import FastPredictor, HybridPredictor
+from src.preprocessor import Preprocessor
+from src.custom_exception import CustomException
+from utils.common_functions import yaml_file_reader
 
 app = Flask(__name__)
 
-loaded_model = joblib.load(SAVED_MODEL_PATH)
+serving_config = yaml_file_reader(CONFIG_PATH)["serving"]
+
+# requests without a model_id are answered by the model of the training pipeline (artifacts/models)
+DEFAULT_MODEL_ID = "default"
+
+micro_batching_config = serving_config["micro_batching"]
+hot_reload_config = serving_config.get("hot_reload", {"enabled": False, "poll_seconds": 5})
+model_registry_config = serving_config.get("model_registry", {"max_models": 8, "max_memory_mb": 1024, "pinned": []})
+drift_config = serving_config.get("drift_monitor", {"enabled": False})
+
+# prometheus style metrics on /metrics, every series is labelled with the model and model version which answered
+metrics_registry = None
+if serving_config.get("metrics", {"enabled": False})["enabled"]:
+    metrics_registry = MetricsRegistry()
+    request_latency = metrics_registry.histogram(
+        "http_request_duration_seconds", "Time from the start of a request to its response", ["route", "method", "model", "model_version"]
+    )
+    stage_latency = metrics_registry.histogram(
+        "http_request_stage_duration_seconds", "Time spent in every stage of a request (parse, predict, render ...)",
+        ["route", "stage", "model", "model_version"]
+    )
+    request_errors = metrics_registry.counter(
+        "http_request_errors", "Requests answered with a 4xx or 5xx status", ["route", "status", "model", "model_version"]
+    )
+    model_latency = metrics_registry.histogram(
+        "model_predict_duration_seconds", "Time of one predict_proba call on the model", ["model", "model_version"]
+    )
+    model_batch_size = metrics_registry.histogram(
+        "model_predict_batch_size", "Rows scored in one predict_proba call", ["model", "model_version"], buckets=BATCH_SIZE_BUCKETS
+    )
+
+
+def predict_proba_timed(model, model_id, version, features):
+    # every model call goes through here, the micro batcher included
+    if metrics_registry is None:
+        return model.predict_proba(features)
+
+    start = time.perf_counter()
+    probabilities = model.predict_proba(features)
+    model_latency.labels(model_id, version).observe(time.perf_counter() - start)
+    model_batch_size.labels(model_id, version).observe(len(features))
+    return probabilities
+
+
+def monitor_drift(serving_model, features, started):
+    # adds the inputs of the request to the drift histograms of its model, returns the start of the next stage
+    if serving_model.drift_monitor is None:
+        return started
+    serving_model.drift_monitor.update(features)
+    return end_stage("drift", started)
+
+
+def end_stage(stage, started):
+    # records the stage which started at `started` and returns the start of the next stage
+    now = time.perf_counter()
+    if metrics_registry is not None:
+        stage_latency.labels(request.url_rule.rule, stage, g.model_id, g.model_version).observe(now - started)
+    return now
+
+
+def resolve_model_path(model_id):
+    # default -> artifacts/models of the training pipeline, any other model id -> MODEL_REGISTRY_DIR/<model_id>/
+    # with the same file names. The compiled model only needs numpy, the pickle pulls in sklearn + lightgbm
+    if model_id == DEFAULT_MODEL_ID:
+        compiled_path, pickle_path = COMPILED_MODEL_PATH, SAVED_MODEL_PATH
+    else:
+        model_dir = os.path.join(MODEL_REGISTRY_DIR, model_id)
+        compiled_path = os.path.join(model_dir, os.path.basename(COMPILED_MODEL_PATH))
+        pickle_path = os.path.join(model_dir, os.path.basename(SAVED_MODEL_PATH))
+
+    if serving_config["model_format"] == "compiled" and os.path.exists(compiled_path):
+        return compiled_path
+    if os.path.exists(pickle_path):
+        return pickle_path
+    raise UnknownModelError(f"No model found for model_id {model_id!r}")
+
+
+def load_serving_model(model_id, model_path, version):
+    # loads one model version with everything it needs, fully warmed up before it takes any traffic
+    if model_path.endswith(".npz"):
+        model = FastPredictor.load(model_path)
+        # large batches go to the LGBMClassifier saved next to it, the compiled trees are slower there
+        pickle_path = os.path.join(os.path.dirname(model_path), os.path.basename(SAVED_MODEL_PATH))
+        compiled_max_rows = serving_config.get("compiled_max_rows")
+        if compiled_max_rows is not None and os.path.exists(pickle_path):
+            model = HybridPredictor(model, lambda: joblib.load(pickle_path), max_rows=compiled_max_rows)
+    else:
+        model = joblib.load(model_path)
+
+    # the 10 selected features the model was trained on, in the same order as processed_train.csv
+    # LGBMClassifier remembers them from the dataframe it was fitted on, the compiled model keeps the same names
+    feature_columns = list(model.feature_name_)
+
+    # score one dummy row, so the first real request does not pay for lazy initialisation
+    model.predict_proba(np.zeros((1, len(feature_columns)), dtype=np.float32))
+
+    # fitted encoders + skewed columns saved by DataProcessor, lets us score raw bookings
+    # (e.g. "Online" instead of 4). Older model folders do not have it yet, then only the encoded routes work
+    preprocessor_path = os.path.join(os.path.dirname(model_path), os.path.basename(PREPROCESSOR_PATH))
+    preprocessor = Preprocessor.load(preprocessor_path) if os.path.exists(preprocessor_path) else None
+
+    # single booking json requests are coalesced into one predict_proba call by the micro batcher
+    # every model version gets its own batcher, rows queued for the old model are scored by the old model
+    micro_batcher = None
+    if micro_batching_config["enabled"]:
+        micro_batcher = MicroBatcher(
+            lambda features: predict_proba_timed(model, model_id, version, features),
+            n_features=len(feature_columns),
+            max_batch_size=micro_batching_config["max_batch_size"],
+            max_wait_ms=micro_batching_config["max_wait_ms"]
+        )
+
+    # live inputs vs the train distribution saved by DataProcessor, only when the model folder has the reference
+    drift_monitor = None
+    drift_reference_path = os.path.join(os.path.dirname(model_path), os.path.basename(DRIFT_REFERENCE_PATH))
+    if drift_config["enabled"] and os.path.exists(drift_reference_path):
+        drift_monitor = DriftMonitor(
+            load_reference(drift_reference_path), feature_columns,
+            window_seconds=drift_config["window_seconds"], min_rows=drift_config["min_rows"]
+        )
+
+    return ServingModel(model, feature_columns, version, model_path, preprocessor, micro_batcher, model_id, drift_monitor)
+
+
+def retire_serving_model(old_model, new_model):
+    # requests which started before the swap may still be waiting on the old batcher,
+    # give them the server timeout to finish before its thread is stopped
+    if old_model.micro_batcher is not None:
+        threading.Timer(serving_config["server"]["timeout"], old_model.micro_batcher.close).start()
+
+
+# repeated feature rows are answered from memory, cached rows belong to the model version which scored them
+# every model gets its own cache, so requests for different models do not invalidate each other
+prediction_cache_config = serving_config.get("prediction_cache", {"enabled": False})
+prediction_caches = {}
+prediction_caches_lock = threading.Lock()
+
+
+def prediction_cache_for(model_id):
+    if not prediction_cache_config["enabled"]:
+        return None
+    cache = prediction_caches.get(model_id)
+    if cache is None:
+        with prediction_caches_lock:
+            cache = prediction_caches.setdefault(model_id, PredictionCache(
+                max_size=prediction_cache_config["max_size"],
+                ttl_seconds=prediction_cache_config["ttl_seconds"]
+            ))
+    return cache
+
+
+def evict_serving_model(model_id, serving_model):
+    # the model left the registry -> its batcher is stopped after the running requests and its cache is dropped
+    retire_serving_model(serving_model, None)
+    with prediction_caches_lock:
+        prediction_caches.pop(model_id, None)
+
+
+# every model (the default one + one per hotel group / region in MODEL_REGISTRY_DIR) is loaded on its first
+# request and kept in an LRU of loaded models (src/model_registry.py). Each model file is watched in the
+# background, a newly trained model is loaded, warmed up and swapped in without a restart.
+# Every request gets its model from the registry ONCE and uses that model until it answers.
+# The default model + the pinned ones are loaded here, with gunicorn's preload_app before the fork,
+# so the workers share them. A model loaded lazily is loaded by every worker which needs it
+model_registry = ModelRegistry(
+    load_serving_model,
+    resolve_model_path,
+    max_models=model_registry_config["max_models"],
+    max_memory_mb=model_registry_config["max_memory_mb"],
+    pinned=[DEFAULT_MODEL_ID, *(model_registry_config.get("pinned") or [])],
+    hot_reload=hot_reload_config["enabled"],
+    poll_seconds=hot_reload_config["poll_seconds"],
+    on_swap=retire_serving_model,
+    on_evict=evict_serving_model
+)
+
+
+def drift_report():
+    # drift scores of every loaded model which has a drift reference, computed now from its histograms
+    report = {}
+    for model_id, serving_model in model_registry.loaded_models():
+        if serving_model.drift_monitor is None:
+            continue
+        scores = serving_model.drift_monitor.scores()
+        psi = [feature["psi"] for feature in scores["features"].values()]
+        scores["max_psi"] = max(psi) if psi else None
+        scores["retrain_recommended"] = bool(psi) and max(psi) > drift_config["psi_threshold"]
+        report[model_id] = {"model_version": serving_model.version, **scores}
+    return report
+
+
+if metrics_registry is not None and drift_config["enabled"]:
+    # computed on every scrape of /metrics, not per request
+    metrics_registry.gauge(
+        "model_input_drift_psi", "Population stability index of a feature, live inputs vs the train split",
+        ["model", "model_version", "feature"],
+        lambda: {
+            (model_id, scores["model_version"], feature): values["psi"]
+            for model_id, scores in drift_report().items() for feature, values in scores["features"].items()
+        }
+    )
+    metrics_registry.gauge(
+        "model_input_drift_ks", "Largest distance between the binned live and train distributions of a feature",
+        ["model", "model_version", "feature"],
+        lambda: {
+            (model_id, scores["model_version"], feature): values["ks"]
+            for model_id, scores in drift_report().items() for feature, values in scores["features"].items()
+        }
+    )
+    metrics_registry.gauge(
+        "model_input_drift_rows", "Rows in the drift windows (no scores below serving -> drift_monitor -> min_rows)",
+        ["model", "model_version"],
+        lambda: {(model_id, scores["model_version"]): scores["rows"] for model_id, scores in drift_report().items()}
+    )
+    metrics_registry.gauge(
+        "model_input_drift_alert", "1 when the psi of any feature is above serving -> drift_monitor -> psi_threshold",
+        ["model", "model_version"],
+        lambda: {(model_id, scores["model_version"]): int(scores["retrain_recommended"]) for model_id, scores in drift_report().items()}
+    )
+
+
+def requested_model_id(payload=None):
+    # ?model_id=... on the url, or "model_id" in the json body / form, otherwise the default model
+    model_id = request.args.get("model_id")
+    if model_id is None and isinstance(payload, dict):
+        model_id = payload.get("model_id")
+    return model_id or DEFAULT_MODEL_ID
+
+
+def get_serving_model(model_id):
+    serving_model = model_registry.get(model_id)
+    g.model_id, g.model_version = model_id, serving_model.version
+    return serving_model
+
+
+@app.errorhandler(UnknownModelError)
+def unknown_model(e):
+    return jsonify({"error": e.args[0], "loaded_models": model_registry.loaded_model_ids()}), 404
+
+
+if metrics_registry is not None:
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        # set by get_serving_model once the route knows which model answers
+        g.model_id, g.model_version = "none", "none"
+
+    @app.after_request
+    def record_request_metrics(response):
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_latency.labels(route, request.method, g.model_id, g.model_version).observe(time.perf_counter() - g.request_start)
+        if response.status_code >= 400:
+            request_errors.labels(route, str(response.status_code), g.model_id, g.model_version).inc()
+        return response
+
+
+def predict_proba_cached(serving_model, features):
+    # only the rows which are not in the cache are sent to the model, in one predict_proba call
+    prediction_cache = prediction_cache_for(serving_model.model_id)
+    if prediction_cache is None:
+        return predict_proba_timed(serving_model.model, serving_model.model_id, serving_model.version, features)
+
+    cached = prediction_cache.get_many(features, serving_model.version)
+    missing = [i for i, value in enumerate(cached) if value is None]
+    if not missing:
+        return np.vstack(cached)
+
+    scored = predict_proba_timed(serving_model.model, serving_model.model_id, serving_model.version, features[missing])
+    prediction_cache.put_many(features[missing], scored, serving_model.version)
+    for i, value in zip(missing, scored):
+        cached[i] = value
+    return np.vstack(cached)
 
 # setup route
 
@@ -16,6 +301,9 @@ loaded_model = joblib.load(SAVED_MODEL_PATH)
 @app.route("/", methods = ["GET", "POST"])
 def index():
     if request.method=='POST':
+        # the time of every stage goes to http_request_stage_duration_seconds on /metrics
+        started = time.perf_counter()
+        serving_model = get_serving_model(requested_model_id(request.form))
 
         lead_time = int(request.form["lead_time"])
         no_of_special_request = int(request.form["no_of_special_request"])
@@ -29,15 +317,288 @@ def index():
 
         type_of_meal_plan = int(request.form["type_of_meal_plan"])
         room_type_reserved = int(request.form["room_type_reserved"])
+        started = end_stage("parse_form", started)
 
+        # float32 like the json routes, so the form and the apis share the same prediction cache entries
+        features = np.array([[lead_time,no_of_special_request,avg_price_per_room,arrival_month,arrival_date,market_segment_type,no_of_week_nights,no_of_weekend_nights,type_of_meal_plan,room_type_reserved]], dtype=np.float32)
+        started = end_stage("build_array", started)
+        started = monitor_drift(serving_model, features, started)
 
-        features = np.array([[lead_time,no_of_special_request,avg_price_per_room,arrival_month,arrival_date,market_segment_type,no_of_week_nights,no_of_weekend_nights,type_of_meal_plan,room_type_reserved]])
-
-        prediction = loaded_model.predict(features)
+        probabilities = predict_proba_cached(serving_model, features)
+        prediction = serving_model.model.classes_[probabilities.argmax(axis=1)]
+        started = end_stage("predict", started)
 
-        return render_template('index.html', prediction=prediction[0])
+        page = render_template('index.html', prediction=prediction[0])
+        end_stage("render", started)
+        return page
     
     return render_template("index.html" , prediction=None)
 
+
+def build_feature_matrix(payload, feature_columns):
+    # the batch api accepts 2 shapes of json
+    # 1. row wise    -> {"records": [{"lead_time": 10, ...}, {"lead_time": 3, ...}]}
+    # 2. column wise -> {"columns": {"lead_time": [10, 3], ...}}
+    # either way we fill one contiguous float32 matrix, one column at a time,
+    # in the same order as feature_columns
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object with 'records' or 'columns'")
+
+    if "records" in payload:
+        records = payload["records"]
+        if not isinstance(records, list) or not records:
+            raise ValueError("'records' must be a non empty list")
+        if not all(isinstance(record, dict) for record in records):
+            raise ValueError("Every record must be a JSON object of feature name -> value")
+
+        features = np.empty((len(records), len(feature_columns)), dtype=np.float32)
+        for j, col in enumerate(feature_columns):
+            try:
+                features[:, j] = [record[col] for record in records]
+            except KeyError:
+                raise ValueError(f"Every record must have the feature '{col}'")
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature '{col}' must be numeric")
+        return features
+
+    if "columns" in payload:
+        columns = payload["columns"]
+        if not isinstance(columns, dict):
+            raise ValueError("'columns' must be an object of feature name -> list of values")
+
+        missing = [col for col in feature_columns if col not in columns]
+        if missing:
+            raise ValueError(f"Missing features: {missing}")
+        if not all(isinstance(columns[col], list) for col in feature_columns):
+            raise ValueError("Every feature in 'columns' must be a list of values")
+
+        n_rows = len(columns[feature_columns[0]])
+        if n_rows == 0:
+            raise ValueError("'columns' must have at least one row")
+
+        features = np.empty((n_rows, len(feature_columns)), dtype=np.float32)
+        for j, col in enumerate(feature_columns):
+            if len(columns[col]) != n_rows:
+                raise ValueError(f"Feature '{col}' has {len(columns[col])} values, expected {n_rows}")
+            try:
+                features[:, j] = columns[col]
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature '{col}' must be numeric")
+        return features
+
+    raise ValueError("Request body must have 'records' or 'columns'")
+
+
+def build_raw_matrix(records, preprocessor):
+    # raw bookings -> model matrix. Every problem with the input becomes a ValueError with a message for the
+    # client, never the text of a CustomException (it has file paths and line numbers of the server)
+    if not all(isinstance(record, dict) for record in records):
+        raise ValueError("Every record must be a JSON object of column name -> value")
+    df = pd.DataFrame.from_records(records)
+
+    missing = [col for col in preprocessor.selected_features if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    # null (or absent in some records) would become the category "None" / NaN and be scored anyway,
+    # /predict/batch rejects the same input -> every feature the model uses must have a value
+    for col in preprocessor.selected_features:
+        null_rows = np.flatnonzero(df[col].isna().to_numpy())
+        if len(null_rows):
+            raise ValueError(f"Column '{col}' must not be null (records {null_rows[:10].tolist()})")
+
+    # everything which is not label encoded goes through float (log1p, the model matrix)
+    numeric_columns = [col for col in df.columns if col not in preprocessor.classes
+                       and (col in preprocessor.selected_features or col in preprocessor.skewed_columns)]
+    for col in numeric_columns:
+        try:
+            df[col] = df[col].astype(np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"Column '{col}' must be numeric")
+
+    try:
+        return preprocessor.to_matrix(df)
+    except CustomException as e:
+        # args[0] is the message without the location
+        raise ValueError(e.args[0])
+
+
+# json api for scoring many bookings in one http request
+# the whole batch is scored with a single predict_proba call, so the per row cost is only the tree walk
+@app.route("/predict/batch", methods = ["POST"])
+def predict_batch():
+    start = time.perf_counter()
+    payload = request.get_json(silent=True)
+    serving_model = get_serving_model(requested_model_id(payload))
+
+    try:
+        features = build_feature_matrix(payload, serving_model.feature_columns)
+    except ValueError as e:
+        return jsonify({"error": str(e), "expected_features": serving_model.feature_columns}), 400
+    started = end_stage("parse", start)
+    started = monitor_drift(serving_model, features, started)
+
+    probabilities = predict_proba_cached(serving_model, features)
+    # same labels as the html form -> 0 means canceled, 1 means not canceled
+    predictions = serving_model.model.classes_[probabilities.argmax(axis=1)]
+    started = end_stage("predict", started)
+
+    response = jsonify({
+        "n_rows": len(features),
+        "probabilities": probabilities[:, 1].tolist(),
+        "predictions": predictions.tolist()
+    })
+    end_stage("serialize", started)
+
+    elapsed = time.perf_counter() - start
+    response.headers["X-Inference-Latency-Ms"] = f"{elapsed * 1000:.3f}"
+    response.headers["X-Rows-Per-Second"] = f"{len(features) / elapsed:.1f}"
+    return response
+
+
+# json api for a single booking -> {"lead_time": 10, "no_of_special_requests": 0, ...}
+# concurrent requests are gathered by the micro batcher and scored together
+@app.route("/predict", methods = ["POST"])
+def predict():
+    started = time.perf_counter()
+    payload = request.get_json(silent=True)
+    serving_model = get_serving_model(requested_model_id(payload))
+
+    try:
+        features = build_feature_matrix({"records": [payload]}, serving_model.feature_columns)
+    except ValueError as e:
+        return jsonify({"error": str(e), "expected_features": serving_model.feature_columns}), 400
+    started = end_stage("parse", started)
+    started = monitor_drift(serving_model, features, started)
+
+    prediction_cache = prediction_cache_for(serving_model.model_id)
+    probabilities = prediction_cache.get(features[0], serving_model.version) if prediction_cache is not None else None
+    if probabilities is None:
+        if serving_model.micro_batcher is not None:
+            probabilities = serving_model.micro_batcher.predict(features[0])
+        else:
+            probabilities = predict_proba_timed(serving_model.model, serving_model.model_id, serving_model.version, features)[0]
+        if prediction_cache is not None:
+            prediction_cache.put(features[0], probabilities, serving_model.version)
+    started = end_stage("predict", started)
+
+    response = jsonify({
+        "probability": float(probabilities[1]),
+        "prediction": int(serving_model.model.classes_[probabilities.argmax()])
+    })
+    end_stage("serialize", started)
+    return response
+
+
+# json api for raw bookings exactly as they are in raw.csv -> {"records": [{"market_segment_type": "Online", ...}]}
+# the saved preprocessor encodes, log transforms and picks the selected features for the whole batch at once
+@app.route("/predict/raw", methods = ["POST"])
+def predict_raw():
+    start = time.perf_counter()
+    payload = request.get_json(silent=True)
+    serving_model = get_serving_model(requested_model_id(payload))
+    if serving_model.preprocessor is None:
+        return jsonify({"error": f"No preprocessor found next to {serving_model.model_path}, run the training pipeline first"}), 503
+
+    records = payload.get("records") if isinstance(payload, dict) else None
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "'records' must be a non empty list"}), 400
+
+    try:
+        features = build_raw_matrix(records, serving_model.preprocessor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    started = end_stage("preprocess", start)
+    started = monitor_drift(serving_model, features, started)
+
+    probabilities = predict_proba_cached(serving_model, features)
+    predictions = serving_model.model.classes_[probabilities.argmax(axis=1)]
+    started = end_stage("predict", started)
+
+    response = jsonify({
+        "n_rows": len(features),
+        "probabilities": probabilities[:, 1].tolist(),
+        "predictions": predictions.tolist()
+    })
+    end_stage("serialize", started)
+
+    elapsed = time.perf_counter() - start
+    response.headers["X-Inference-Latency-Ms"] = f"{elapsed * 1000:.3f}"
+    response.headers["X-Rows-Per-Second"] = f"{len(features) / elapsed:.1f}"
+    return response
+
+
+# micro batcher and prediction cache numbers of one loaded model -> /predict/stats?model_id=...
+@app.route("/predict/stats", methods = ["GET"])
+def predict_stats():
+    model_id = requested_model_id()
+    model_reloader = model_registry.reloader(model_id)
+    if model_reloader is None:
+        raise UnknownModelError(f"Model {model_id!r} is not loaded")
+
+    micro_batcher = model_reloader.current.micro_batcher
+    stats = {"model_id": model_id, "micro_batching": micro_batcher is not None}
+    if micro_batcher is not None:
+        stats.update(micro_batcher.stats())
+    prediction_cache = prediction_cache_for(model_id)
+    stats["prediction_cache"] = prediction_cache.stats() if prediction_cache is not None else None
+    return jsonify(stats)
+
+
+# admin api -> which version of a model is answering requests, when it was loaded and how many reloads happened
+# (?model_id=..., the default model otherwise). POST checks the model file right now instead of waiting for the next poll
+@app.route("/admin/model", methods = ["GET", "POST"])
+def admin_model():
+    model_id = requested_model_id()
+    get_serving_model(model_id)
+    model_reloader = model_registry.reloader(model_id)
+    if request.method == "POST":
+        reloaded = model_reloader.check()
+        return jsonify({"reloaded": reloaded, **model_reloader.status()})
+    return jsonify(model_reloader.status())
+
+
+# every model of the registry -> loaded models with their memory estimate, load time, hits, misses and evictions
+@app.route("/admin/models", methods = ["GET"])
+def admin_models():
+    return jsonify(model_registry.stats())
+
+# drift of the live inputs of every loaded model -> psi / ks per feature and whether a retrain is recommended
+@app.route("/admin/drift", methods = ["GET"])
+def admin_drift():
+    if not drift_config["enabled"]:
+        return jsonify({"error": "the drift monitor is disabled in config.yaml (serving -> drift_monitor -> enabled)"}), 404
+    return jsonify({"psi_threshold": drift_config["psi_threshold"], "models": drift_report()})
+
+# prometheus scrape endpoint -> request / stage / model latency histograms, batch sizes and error counts
+@app.route("/metrics", methods = ["GET"])
+def metrics():
+    if metrics_registry is None:
+        return jsonify({"error": "metrics are disabled in config.yaml (serving -> metrics -> enabled)"}), 404
+    return Response(metrics_registry.exposition(), mimetype="text/plain; version=0.0.4")
+
+# liveness -> the process is up and answering
+@app.route("/health", methods = ["GET"])
+def health():
+    return jsonify({"status": "ok"})
+
+
+# readiness -> the model is loaded and warmed up, the load balancer can send traffic
+@app.route("/ready", methods = ["GET"])
+def ready():
+    model_reloader = model_registry.reloader(DEFAULT_MODEL_ID)
+    if model_reloader is None:
+        return jsonify({"status": "loading"}), 503
+    serving_model = model_reloader.current
+    return jsonify({
+        "status": "ready",
+        "model": type(serving_model.model).__name__,
+        "model_version": serving_model.version,
+        "n_features": len(serving_model.feature_columns),
+        "preprocessor": serving_model.preprocessor is not None,
+        "loaded_models": model_registry.loaded_model_ids()
+    })
+
+# development server only, in production use -> gunicorn --config gunicorn.conf.py application:app
 if __name__=="__main__":
     app.run(host='0.0.0.0' , port=8080)
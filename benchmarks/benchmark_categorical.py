@@ -0,0 +1,65 @@
+#########
+# Benchmark - label encoded codes as numbers vs native lightgbm categorical features
+########
+
+# python benchmarks/benchmark_categorical.py
+# runs DataProcessor's preprocessing + balancing on the raw splits once per categorical_mode
+# (SMOTE for label, SMOTE-NC for native), keeps the currently selected features, then trains the same
+# lightgbm model with early stopping on the test split and compares trees, model size, speed and accuracy
+
+import time
+import warnings
+import lightgbm as lgb
+from sklearn.metrics import accuracy_score
+from src.data_preprocessing import DataProcessor
+from utils.common_functions import load_data
+from config.paths import *
+
+MODEL_PARAMS = {"n_estimators": 1000, "learning_rate": 0.05, "num_leaves": 63, "random_state": 99, "verbose": -1}
+EARLY_STOPPING_ROUNDS = 50
+
+
+def prepare(mode, features):
+    processor = DataProcessor(TRAIN_FILE_PATH, TEST_FILE_PATH, PROCESSED_DIR, CONFIG_PATH)
+    processor.config["data_preprocessing"]["categorical_mode"] = mode
+
+    train_df = processor.preprocess_data(load_data(TRAIN_FILE_PATH), fit=True)
+    test_df = processor.preprocess_data(load_data(TEST_FILE_PATH))
+    start = time.perf_counter()
+    train_df = processor.balancing_data(train_df)
+    balancing_time = time.perf_counter() - start
+
+    categorical = [col for col in features if col in processor.preprocessor.categorical_columns] if mode == "native" else "auto"
+    return train_df, test_df, categorical, balancing_time
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+    features = load_data(PROCESSED_TRAIN_DIR).columns.drop("booking_status").tolist()
+
+    print(f"{'mode':8} {'balance s':>10} {'fit s':>8} {'trees':>6} {'leaves':>7} {'model KB':>9} {'predict ms':>11} {'accuracy':>9}")
+    for mode in ["label", "native"]:
+        train_df, test_df, categorical, balancing_time = prepare(mode, features)
+        X_train, y_train = train_df[features], train_df["booking_status"]
+        X_test, y_test = test_df[features], test_df["booking_status"]
+
+        model = lgb.LGBMClassifier(**MODEL_PARAMS)
+        start = time.perf_counter()
+        model.fit(
+            X_train, y_train, categorical_feature=categorical,
+            eval_set=[(X_test, y_test)], callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)]
+        )
+        fit_time = time.perf_counter() - start
+
+        booster = model.booster_
+        n_trees = model.best_iteration_ or booster.current_iteration()
+        n_leaves = sum(tree["num_leaves"] for tree in booster.dump_model(num_iteration=n_trees)["tree_info"])
+        model_kb = len(booster.model_to_string(num_iteration=n_trees)) / 1024
+
+        X_test_matrix = X_test.to_numpy(dtype="float32")
+        start = time.perf_counter()
+        predictions = model.predict(X_test_matrix)
+        predict_time = time.perf_counter() - start
+
+        print(f"{mode:8} {balancing_time:10.2f} {fit_time:8.2f} {n_trees:6d} {n_leaves:7d} {model_kb:9.1f} "
+              f"{1000 * predict_time:11.2f} {accuracy_score(y_test, predictions):9.4f}")
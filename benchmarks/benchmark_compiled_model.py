@@ -0,0 +1,66 @@
+#########
+# Benchmark - pickled LGBMClassifier vs compiled numpy FastPredictor for serving
+########
+
+# python benchmarks/benchmark_compiled_model.py
+# 1. cold start -> a fresh python process which only loads the model (imports included)
+# 2. latency    -> predict_proba on batches of different sizes from the processed test data
+# 3. parity     -> largest difference between both probabilities
+# the compiled model is built from the pickle here if the training pipeline did not export it yet
+
+import os
+import sys
+import time
+import subprocess
+import warnings
+import joblib
+import numpy as np
+from src.fast_predictor import compile_lightgbm_model, save_compiled_model, FastPredictor
+from utils.common_functions import load_data
+from config.paths import *
+
+BATCH_SIZES = [1, 10, 100, 1000]
+REPEATS = 20
+COLD_START_RUNS = 5
+
+PICKLE_LOAD = f"import joblib; joblib.load({SAVED_MODEL_PATH!r})"
+COMPILED_LOAD = f"from src.fast_predictor import FastPredictor; FastPredictor.load({COMPILED_MODEL_PATH!r})"
+
+
+def cold_start(code):
+    # best of a few runs, every run is a new interpreter so nothing is imported yet
+    times = []
+    for _ in range(COLD_START_RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, env={**os.environ, "PYTHONWARNINGS": "ignore"})
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def latency(model, X):
+    model.predict_proba(X)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        model.predict_proba(X)
+    return 1000 * (time.perf_counter() - start) / REPEATS
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings("ignore")
+    pickled = joblib.load(SAVED_MODEL_PATH)
+    if not os.path.exists(COMPILED_MODEL_PATH):
+        save_compiled_model(compile_lightgbm_model(pickled), COMPILED_MODEL_PATH)
+    compiled = FastPredictor.load(COMPILED_MODEL_PATH)
+
+    X_test = load_data(PROCESSED_TEST_DIR)[compiled.feature_name_].to_numpy(dtype=np.float32)
+
+    print(f"cold start (python + load)   pickle {cold_start(PICKLE_LOAD):.3f}s   compiled {cold_start(COMPILED_LOAD):.3f}s")
+    print(f"model file size              pickle {os.path.getsize(SAVED_MODEL_PATH) / 1024:.0f} KB   "
+          f"compiled {os.path.getsize(COMPILED_MODEL_PATH) / 1024:.0f} KB")
+
+    for batch_size in BATCH_SIZES:
+        X = X_test[:batch_size]
+        print(f"batch {batch_size:5d} latency           pickle {latency(pickled, X):8.3f} ms   compiled {latency(compiled, X):8.3f} ms")
+
+    difference = np.abs(pickled.predict_proba(X_test) - compiled.predict_proba(X_test)).max()
+    print(f"max probability difference on {len(X_test)} rows: {difference:.2e}")
@@ -0,0 +1,64 @@
+#########
+# Benchmark - pandas frames per fit vs one prebuilt lightgbm Dataset shared by all folds and candidates
+########
+
+# python benchmarks/benchmark_dataset_binning.py
+# fits the same candidates on the same folds twice, both with the validation fold as eval set:
+#   1. the old way -> LGBMClassifier.fit on pandas slices, every fit converts and bins the data again
+#   2. ModelTraining.build_fold_datasets + fit_fold -> converted and binned once, folds are Dataset subsets
+
+import time
+import warnings
+import lightgbm as lgb
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+from src.model_training import ModelTraining
+from config.paths import *
+from config.model_params import *
+
+N_CANDIDATES = 5
+ROUNDS = 100
+
+if __name__ == "__main__":
+    # dart candidates warn that they can not early stop on every single fit
+    warnings.filterwarnings("ignore", message="Early stopping is not available in dart mode")
+
+    trainer = ModelTraining(PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, SAVED_MODEL_PATH)
+    X_train, y_train, _, _ = trainer.load_split_data()
+
+    params = HALVING_SEARCH_PARAMS
+    candidates = [
+        {**candidate, "n_estimators": ROUNDS}
+        for candidate in ParameterSampler(LIGHGBM_PARAMS, n_iter=N_CANDIDATES, random_state=params["random_state"])
+    ]
+    folds = list(StratifiedKFold(n_splits=params["cv"], shuffle=True, random_state=params["random_state"]).split(X_train, y_train))
+
+    # 1. pandas frames handed to every fit
+    start = time.perf_counter()
+    for candidate in candidates:
+        for train_idx, val_idx in folds:
+            model = lgb.LGBMClassifier(random_state=params["random_state"], n_jobs=params["lgbm_threads"], verbose=-1, **candidate)
+            X_val, y_val = X_train.iloc[val_idx], y_train.iloc[val_idx]
+            model.fit(
+                X_train.iloc[train_idx], y_train.iloc[train_idx],
+                eval_set=[(X_val, y_val)], callbacks=[lgb.early_stopping(ROUNDS, verbose=False)]
+            )
+            model.predict_proba(X_val)
+    pandas_time = time.perf_counter() - start
+
+    # 2. binned once, reused through Dataset subsets
+    start = time.perf_counter()
+    fold_datasets = trainer.build_fold_datasets(X_train, y_train, folds)
+    build_time = time.perf_counter() - start
+    native_params = {"objective": "binary", "seed": params["random_state"], "num_threads": params["lgbm_threads"], "verbose": -1}
+    for candidate in candidates:
+        for fold_dataset in fold_datasets:
+            # early stopping rounds = ROUNDS so both versions train the same number of trees
+            trainer.fit_fold({**native_params, **candidate}, fold_dataset, ROUNDS, ROUNDS, params["scoring"])
+    dataset_time = time.perf_counter() - start
+
+    n_fits = len(candidates) * len(folds)
+    print(f"{n_fits} fits of {ROUNDS} rounds on {X_train.shape[0]} rows x {X_train.shape[1]} features")
+    print(f"pandas frames per fit : {pandas_time:.2f}s ({1000 * pandas_time / n_fits:.1f} ms per fit)")
+    print(f"prebuilt Dataset      : {dataset_time:.2f}s ({1000 * dataset_time / n_fits:.1f} ms per fit, "
+          f"{1000 * build_time:.1f} ms to bin once)")
+    print(f"speedup               : {pandas_time / dataset_time:.2f}x")
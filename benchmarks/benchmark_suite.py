@@ -0,0 +1,364 @@
+#########
+# Benchmark suite - pipeline steps + serving, compared against a stored baseline
+########
+
+# python benchmarks/benchmark_suite.py                          -> run everything, compare with benchmarks/baseline.json
+# python benchmarks/benchmark_suite.py --scales 1 10            -> skip the (slow) 100x data set
+# python benchmarks/benchmark_suite.py --skip-pipeline          -> only the serving benchmark
+# python benchmarks/benchmark_suite.py --save-baseline          -> store this run as the new baseline
+# python benchmarks/benchmark_suite.py --require-baseline       -> CI (Jenkinsfile), a missing baseline fails the build
+#
+# 1. pipeline -> artifacts/raw/raw.csv is upsampled to 10x / 100x (every copy gets new Booking_IDs and a little
+#    noise on lead_time + avg_price_per_room, so drop_duplicates does not just throw the copies away).
+#    For every scale a fresh python process runs every DataIngestion / DataProcessor / ModelTraining step
+#    in its own folder (artifacts/benchmarks/x<scale>) and records duration, peak RSS and rows per step.
+#    The search is cut down to BENCHMARK_SEARCH so 100x finishes, mlflow logging is not part of the benchmark
+# 2. serving  -> the flask app (with the 1x model) through its test client: single row /predict and
+#    /predict/batch latency percentiles + throughput
+# 3. compare  -> every metric is compared with the baseline, a metric which got worse by more than its
+#    threshold is a regression and the script exits with code 1, so it can block a deploy
+#
+# Numbers depend on the machine, store the baseline on the same machine (or CI runner) which runs the comparison
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_CSV = os.path.join(REPO_ROOT, "artifacts", "raw", "raw.csv")
+WORK_DIR = os.path.join(REPO_ROOT, "artifacts", "benchmarks")
+RESULTS_PATH = os.path.join(REPO_ROOT, "benchmarks", "results", "latest.json")
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+
+SCALES = [1, 10, 100]
+BENCHMARK_SEARCH = {"n_iter": 2, "cv": 2, "verbose": 0}
+SINGLE_REQUESTS = 500
+BATCH_SIZES = [100, 1000]
+BATCH_REQUESTS = 50
+WARMUP_REQUESTS = 20
+
+# metric suffix -> (allowed relative change, absolute change always ignored as noise, higher_is_better)
+# max_ms is reported but not compared, a single slow request (gc, another process) is not a regression
+THRESHOLDS = {
+    "duration_s": (0.25, 0.05, False),
+    "peak_rss_mb": (0.15, 10.0, False),
+    "p50_ms": (0.30, 0.05, False),
+    "p90_ms": (0.30, 0.05, False),
+    "p99_ms": (0.50, 0.10, False),
+    "rows_per_s": (0.25, 0.0, True),
+}
+
+
+######## steps ########
+# every step runs inside src.instrumentation.instrument -> wall time, rows and its own peak RSS
+# (the instrumented methods inside the step are nested steps, they do not reset the peak of the outer one)
+
+def measure(results, step, fn, rows=None):
+    # rows -> function(output) -> number of rows the step produced
+    from src.instrumentation import instrument, step_records
+
+    with instrument(step) as running:
+        output = fn()
+        if rows is not None:
+            running.rows = rows(output)
+
+    results[step] = {key: value for key, value in step_records[-1].items() if key != "step"}
+    print(f"    {step:<32} {results[step]}", flush=True)
+    return output
+
+
+######## data ########
+
+def upsample(raw, scale, seed=99):
+    if scale == 1:
+        return raw
+
+    rng = np.random.default_rng(seed)
+    copies = [raw]
+    for k in range(1, scale):
+        copy = raw.copy()
+        copy["Booking_ID"] = copy["Booking_ID"] + f"_{k}"
+        copy["lead_time"] = np.clip(copy["lead_time"] + rng.integers(-3, 4, len(copy)), 0, None)
+        copy["avg_price_per_room"] = (copy["avg_price_per_room"] * rng.normal(1, 0.02, len(copy))).round(2)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def prepare_workdir(scale):
+    # artifacts/benchmarks/x<scale>/
+    #   bucket/<bucket_file_name>   -> the upsampled csv, the local storage backend "downloads" it from here
+    #   config/config.yaml          -> the repo config with the local storage backend
+    #   artifacts/ logs/            -> written by the pipeline, removed before every run
+    workdir = os.path.join(WORK_DIR, f"x{scale}")
+
+    with open(os.path.join(REPO_ROOT, "config", "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    config["data_ingestion"]["storage_backend"] = "local"
+    config["data_ingestion"]["local_storage_dir"] = "bucket"
+
+    bucket_file = os.path.join(workdir, "bucket", config["data_ingestion"]["bucket_file_name"])
+    if not os.path.exists(bucket_file):
+        os.makedirs(os.path.dirname(bucket_file), exist_ok=True)
+        print(f"Creating the {scale}x data set at {bucket_file}", flush=True)
+        upsample(pd.read_csv(RAW_CSV), scale).to_csv(bucket_file, index=False)
+
+    for folder in ["artifacts", "logs", "mlruns"]:
+        shutil.rmtree(os.path.join(workdir, folder), ignore_errors=True)
+    os.makedirs(os.path.join(workdir, "config"), exist_ok=True)
+    with open(os.path.join(workdir, "config", "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    return workdir
+
+
+######## 1. pipeline ########
+
+def run_pipeline_steps(workdir):
+    # runs in its own process (run_isolated), already inside workdir
+
+    import warnings
+    warnings.filterwarnings("ignore")
+    from config.paths import (CONFIG_PATH, TRAIN_FILE_PATH, TEST_FILE_PATH, PROCESSED_DIR,
+                              PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, PREPROCESSOR_PATH, SAVED_MODEL_PATH)
+    from src.instrumentation import configure
+    from src.data_ingestion import DataIngestion
+    from src.data_preprocessing import DataProcessor
+    from src.model_training import ModelTraining
+    from utils.common_functions import yaml_file_reader, load_data
+
+    configure(enabled=True, track_memory=True)
+    steps = {}
+
+    # 1. ingestion
+    ingestion = DataIngestion(yaml_file_reader(CONFIG_PATH))
+    measure(steps, "ingestion.download", ingestion.download_csv_from_gcp)
+    measure(steps, "ingestion.split", ingestion.split_data, rows=lambda _: len(load_data(TRAIN_FILE_PATH, columns=["Booking_ID"])))
+
+    # 2. processing -> the same steps as DataProcessor.process, one by one
+    processor = DataProcessor(TRAIN_FILE_PATH, TEST_FILE_PATH, PROCESSED_DIR, CONFIG_PATH)
+    train_df = measure(steps, "processing.load", lambda: load_data(TRAIN_FILE_PATH), rows=len)
+    test_df = load_data(TEST_FILE_PATH)
+    train_df = measure(steps, "processing.preprocess", lambda: processor.preprocess_data(train_df, fit=True), rows=len)
+    test_df = processor.preprocess_data(test_df)
+    train_df = measure(steps, "processing.balancing", lambda: processor.balancing_data(train_df), rows=len)
+    train_df = measure(steps, "processing.feature_selection", lambda: processor.feature_selection(train_df), rows=len)
+    test_df = test_df[train_df.columns]
+    processor.preprocessor.selected_features = train_df.columns.drop("booking_status").tolist()
+    processor.preprocessor.save(PREPROCESSOR_PATH)
+
+    def save_processed():
+        processor.save_processed_data(train_df, PROCESSED_TRAIN_DIR)
+        processor.save_processed_data(test_df, PROCESSED_TEST_DIR)
+    measure(steps, "processing.save", save_processed)
+
+    # 3. training
+    trainer = ModelTraining(PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, SAVED_MODEL_PATH)
+    trainer.random_search_params = {**trainer.random_search_params, **BENCHMARK_SEARCH}
+    trainer.halving_search_params = {**trainer.halving_search_params, "n_candidates": 4, "cv": BENCHMARK_SEARCH["cv"]}
+    X_train, y_train, X_test, y_test = measure(steps, "training.load", trainer.load_split_data, rows=lambda out: len(out[0]))
+    model = measure(steps, "training.search", lambda: trainer.train_lgbm(X_train, y_train))
+    metrics = measure(steps, "training.evaluate", lambda: trainer.evaluate_model(model, X_test, y_test))
+    measure(steps, "training.save", lambda: trainer.save_model(model))
+    measure(steps, "training.export_compiled", lambda: trainer.export_compiled_model(model, X_test))
+
+    return {"steps": steps, "model_metrics": metrics}
+
+
+######## 2. serving ########
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "max_ms": round(float(latencies.max()), 4),
+    }
+
+
+def run_serving(workdir):
+    # the app of the 1x workdir -> model, compiled model and preprocessor from the pipeline benchmark
+    # runs in its own process (run_isolated), already inside workdir
+
+    import warnings
+    warnings.filterwarnings("ignore")
+    from config.paths import PROCESSED_TEST_DIR
+    from utils.common_functions import load_data
+    import application
+
+    client = application.app.test_client()
+    feature_columns = application.model_registry.get(application.DEFAULT_MODEL_ID).feature_columns
+    rows = load_data(PROCESSED_TEST_DIR)[feature_columns]
+    records = rows.to_dict(orient="records")
+    results = {}
+
+    # single row -> one request per booking, like the booking page
+    for record in records[:WARMUP_REQUESTS]:
+        client.post("/predict", json=record)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(SINGLE_REQUESTS):
+        request_start = time.perf_counter()
+        response = client.post("/predict", json=records[i % len(records)])
+        latencies.append(time.perf_counter() - request_start)
+        assert response.status_code == 200, response.get_json()
+    results["single"] = {**percentiles(latencies), "rows_per_s": round(SINGLE_REQUESTS / (time.perf_counter() - start), 1)}
+    print(f"    {'serving.single':<32} {results['single']}", flush=True)
+
+    # batch -> BATCH_REQUESTS requests of batch_size rows each
+    for batch_size in BATCH_SIZES:
+        batches = [
+            {"records": [records[(i * batch_size + j) % len(records)] for j in range(batch_size)]}
+            for i in range(BATCH_REQUESTS)
+        ]
+        client.post("/predict/batch", json=batches[0])
+        latencies = []
+        start = time.perf_counter()
+        for batch in batches:
+            request_start = time.perf_counter()
+            response = client.post("/predict/batch", json=batch)
+            latencies.append(time.perf_counter() - request_start)
+            assert response.status_code == 200, response.get_json()
+        results[f"batch_{batch_size}"] = {
+            **percentiles(latencies),
+            "rows_per_s": round(BATCH_REQUESTS * batch_size / (time.perf_counter() - start), 1)
+        }
+        print(f"    {f'serving.batch_{batch_size}':<32} {results[f'batch_{batch_size}']}", flush=True)
+
+    return results
+
+
+######## 3. compare ########
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def threshold_for(metric):
+    for suffix, threshold in THRESHOLDS.items():
+        if metric.endswith(suffix):
+            return threshold
+    return None
+
+
+def compare(current, baseline):
+    current, baseline = flatten(current), flatten(baseline)
+    regressions = []
+
+    for metric, value in sorted(current.items()):
+        threshold = threshold_for(metric)
+        if threshold is None or metric not in baseline:
+            continue
+        allowed, noise, higher_is_better = threshold
+        base = baseline[metric]
+
+        change = (base - value) if higher_is_better else (value - base)
+        if base > 0 and change > noise and change / base > allowed:
+            regressions.append(f"{metric}: {base} -> {value} ({100 * change / base:+.1f}% worse, allowed {100 * allowed:.0f}%)")
+
+    return regressions
+
+
+def run_in_workdir(fn, workdir):
+    # runs in the fresh process. config.paths and src.logger read config/config.yaml relative to the working
+    # directory, so we have to chdir BEFORE importing anything from the project
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    from src.task_graph import call_with_traceback
+    return call_with_traceback(fn, workdir)
+
+
+def run_isolated(fn, workdir):
+    # a fresh interpreter for every run -> imports, caches and peak memory of one run do not leak into the next
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_in_workdir, fn, workdir).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline and serving benchmarks")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="data set sizes as multiples of raw.csv")
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--skip-serving", action="store_true")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline instead of comparing")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="exit with code 1 when there is no baseline (CI), instead of only printing a hint")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "pipeline": {},
+    }
+
+    if not args.skip_pipeline:
+        for scale in args.scales:
+            print(f"Pipeline benchmark on {scale}x raw.csv", flush=True)
+            results["pipeline"][f"x{scale}"] = run_isolated(run_pipeline_steps, prepare_workdir(scale))
+
+    if not args.skip_serving:
+        serving_dir = os.path.join(WORK_DIR, "x1")
+        if not os.path.exists(os.path.join(serving_dir, "artifacts", "models")):
+            print("Training the 1x model for the serving benchmark", flush=True)
+            run_isolated(run_pipeline_steps, prepare_workdir(1))
+        print("Serving benchmark", flush=True)
+        results["serving"] = run_isolated(run_serving, serving_dir)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.save_baseline:
+        if os.path.dirname(args.baseline):
+            os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run again with --save-baseline to store one")
+        # without a baseline nothing was compared, in CI that must not pass as "no regressions"
+        sys.exit(1 if args.require_baseline else 0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    # meta (commit, dates) and model quality are not performance numbers, only metrics with a threshold are compared
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"{len(regressions)} regressions against {args.baseline}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"No regressions against {args.baseline}")
@@ -16,4 +16,28 @@ RANDOM_SEARCH_PARAMS = {
     "verbose": 2,
     "random_state": 99,
     "scoring": "accuracy"
-}
\ No newline at end of file
+}
+
+# which hyper parameter search ModelTraining uses
+# random  -> RandomizedSearchCV above, every candidate trains all its n_estimators on every fold
+# halving -> successive halving: many candidates start with few boosting rounds, only the best 1/factor
+#            move on to the next rung with factor x more rounds, every fit early stops on its validation fold
+# Only halving uses the lightgbm Dataset which is binned once and shared by all folds and candidates
+# (ModelTraining.build_fold_datasets). random hands pandas frames to RandomizedSearchCV, so every one of
+# its n_iter x cv fits converts and bins the train data again
+SEARCH_MODE = "random"
+
+HALVING_SEARCH_PARAMS = {
+    "n_candidates": 100,
+    "cv": 5,
+    "min_rounds": 20,
+    "max_rounds": 500,
+    "factor": 3,
+    "early_stopping_rounds": 20,
+    # threads for every lightgbm fit, the remaining cores run candidates/folds in parallel
+    # -> n_jobs=-1 with lgbm_threads=1 on 16 cores trains 16 models at once with 1 thread each
+    "lgbm_threads": 1,
+    "n_jobs": -1,
+    "random_state": 99,
+    "scoring": "accuracy"
+}
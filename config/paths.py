@@ -1,5 +1,16 @@
 # Here we will list all the paths
 import os
+import yaml
+
+##############################
+# We want to read data from config.yaml
+CONFIG_PATH = "config/config.yaml"
+
+# Every stage hands its data to the next one as a file. CSV has to be parsed and every float re-formatted
+# each time, so by default we use a columnar binary format (parquet) which keeps the dtypes and is much smaller.
+# The format is chosen in config.yaml under artifacts -> format : parquet | feather | csv
+with open(CONFIG_PATH, "r") as config_file:
+    ARTIFACT_FORMAT = (yaml.safe_load(config_file).get("artifacts") or {}).get("format", "parquet")
 
 ######### Create Paths For Data Ingestion ###########
 
@@ -8,19 +19,32 @@ import os
 
 RAW_DIR = "artifacts/raw"
 # after the data gets extracted, it will come in a whole file as raw, where we want to store it
+# the raw export from the bucket is always csv, the splits use ARTIFACT_FORMAT
 RAW_FILE_PATH = os.path.join(RAW_DIR, "raw.csv")
-TRAIN_FILE_PATH = os.path.join(RAW_DIR, "train.csv")
-TEST_FILE_PATH = os.path.join(RAW_DIR, "test.csv")
-
-##############################
-# We want to read data from config.yaml
-CONFIG_PATH = "config/config.yaml"
+# generation + md5 of the bucket object we downloaded last, so unchanged data is not downloaded again
+RAW_MANIFEST_PATH = os.path.join(RAW_DIR, "raw_manifest.json")
+TRAIN_FILE_PATH = os.path.join(RAW_DIR, f"train.{ARTIFACT_FORMAT}")
+TEST_FILE_PATH = os.path.join(RAW_DIR, f"test.{ARTIFACT_FORMAT}")
 
 
 ################## ALL THE PATHS REQUIRED FOR DATA PROCESSING STEP ###################
 PROCESSED_DIR = "artifacts/processed"
-PROCESSED_TRAIN_DIR = os.path.join(PROCESSED_DIR, "processed_train.csv")
-PROCESSED_TEST_DIR = os.path.join(PROCESSED_DIR, "processed_test.csv")
+PROCESSED_TRAIN_DIR = os.path.join(PROCESSED_DIR, f"processed_train.{ARTIFACT_FORMAT}")
+PROCESSED_TEST_DIR = os.path.join(PROCESSED_DIR, f"processed_test.{ARTIFACT_FORMAT}")
+# feature ranking from the last feature selection + fingerprint of the data it was computed on
+FEATURE_RANKING_PATH = os.path.join(PROCESSED_DIR, "feature_ranking.json")
 
 ################### MODEL TRAINING ###############
-SAVED_MODEL_PATH = "artifacts/models/lgbm_model.pkl"
\ No newline at end of file
+SAVED_MODEL_PATH = "artifacts/models/lgbm_model.pkl"
+# the same trees as numpy arrays, loaded by the flask app without sklearn / lightgbm (see src/fast_predictor.py)
+COMPILED_MODEL_PATH = "artifacts/models/lgbm_model.npz"
+# fitted label encodings, skewed columns and selected features -> shared by training and the flask app
+PREPROCESSOR_PATH = "artifacts/models/preprocessor.pkl"
+# binned distribution of every selected train feature, the flask app compares the live inputs with it
+DRIFT_REFERENCE_PATH = "artifacts/models/drift_reference.json"
+# one folder per served model (hotel group / region) with the same 3 files, picked by model_id in a request
+MODEL_REGISTRY_DIR = "artifacts/models/registry"
+
+################### PIPELINE STAGE CACHE ###############
+# one small json manifest per stage with the fingerprint of its inputs and the hashes of its outputs
+STAGE_CACHE_DIR = "artifacts/cache"
@@ -0,0 +1,37 @@
+# Production entry point for the flask app:
+#     gunicorn --config gunicorn.conf.py application:app
+# (python application.py still starts flask's single process development server, only use it locally)
+#
+# - preload_app -> application.py (and so the model) is loaded ONCE in the master process before the
+#   workers are forked. The workers share the model's memory pages copy-on-write instead of each
+#   loading its own copy, and a new worker is ready immediately.
+# - workers x threads -> every worker is a process with a few threads, so requests are served in parallel
+#   and the micro batcher in every worker can coalesce the concurrent requests of its threads
+# - OMP_NUM_THREADS -> lightgbm (pickle model_format) uses OpenMP, by default every worker would start one
+#   thread per core. We give every worker cores / workers threads. It must be set before lightgbm is imported,
+#   which is why it is done here and not in application.py
+
+import os
+import multiprocessing
+import yaml
+
+with open("config/config.yaml", "r") as config_file:
+    server_config = yaml.safe_load(config_file)["serving"]["server"]
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_WORKERS") or server_config["workers"] or cores)
+threads = int(os.environ.get("WEB_THREADS") or server_config["threads"])
+worker_class = "gthread"
+timeout = server_config["timeout"]
+preload_app = True
+
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, cores // workers)))
+
+# every worker writes to the same log file, rotating it from inside the workers is not safe -> logrotate
+# rotates logs/app.log (src/logger.py reopens it), or LOG_TARGET=stderr to send the logs to gunicorn's stderr.
+# Like OMP_NUM_THREADS it has to be set before application.py (and src/logger.py) is imported
+os.environ.setdefault("LOG_ROTATION", "none")
+
+accesslog = "-"
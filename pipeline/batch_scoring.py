@@ -0,0 +1,24 @@
+
+#########
+# Batch Scoring Pipeline
+########
+
+# Scores a file of raw bookings (same columns as raw.csv, booking_status is optional) with the trained model
+# python pipeline/batch_scoring.py --input bookings.csv --output predictions.parquet
+# python pipeline/batch_scoring.py --input bookings.parquet --output predictions.csv --workers 4 --chunk-rows 50000
+# the input and output formats are picked from the file extensions -> .csv, .parquet or .feather
+
+import argparse
+from src.batch_scoring import BatchScorer
+from config.paths import *
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hotel reservation batch scoring")
+    parser.add_argument("--input", required=True, help="file of bookings to score")
+    parser.add_argument("--output", required=True, help="where to write Booking_ID, probability and prediction")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: batch_scoring -> n_workers in config.yaml)")
+    parser.add_argument("--chunk-rows", type=int, default=None, help="rows per chunk (default: batch_scoring -> chunk_rows in config.yaml)")
+    args = parser.parse_args()
+
+    batch_scorer = BatchScorer(args.input, args.output, CONFIG_PATH, n_workers=args.workers, chunk_rows=args.chunk_rows)
+    batch_scorer.run()
@@ -0,0 +1,20 @@
+
+#########
+# Incremental Training Pipeline
+########
+
+# Adds boosting rounds to the saved model on newly arrived bookings (same columns as raw.csv) instead of
+# a full retrain, falls back to a full retrain when the new model is worse than the last full one
+# python pipeline/incremental_training.py --new-data artifacts/raw/new_bookings.csv
+
+import argparse
+from src.incremental_training import IncrementalTraining
+from config.paths import *
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hotel reservation incremental training")
+    parser.add_argument("--new-data", required=True, help="file of new bookings with booking_status (.csv, .parquet or .feather)")
+    args = parser.parse_args()
+
+    incremental_training = IncrementalTraining(args.new_data, CONFIG_PATH)
+    incremental_training.run()
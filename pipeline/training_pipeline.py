@@ -3,24 +3,88 @@
 # Trainig Pipeline
 ########
 
+# Every stage is skipped when its inputs did not change since the last run (see src/stage_cache.py)
+# python pipeline/training_pipeline.py                      -> run only what changed
+# python pipeline/training_pipeline.py --force training     -> always re run the training stage
+# python pipeline/training_pipeline.py --force all          -> run everything
 
+import argparse
 from src.data_ingestion import DataIngestion
 from src.data_preprocessing import DataProcessor
 from src.model_training import ModelTraining
+from src.stage_cache import StageCache
+from src.task_graph import TaskGraph
 from utils.common_functions import yaml_file_reader
 from config.paths import *
+from config.model_params import *
+
+STAGES = ["ingestion", "processing", "training"]
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hotel reservation training pipeline")
+    parser.add_argument("--force", action="append", default=[], choices=STAGES + ["all"],
+                        help="re run this stage even if its inputs did not change (can be repeated)")
+    args = parser.parse_args()
+    forced = set(STAGES) if "all" in args.force else set(args.force)
+
+    config = yaml_file_reader(CONFIG_PATH)
+    cache = StageCache(STAGE_CACHE_DIR)
+
     # when someone runs this file, the things which we want to happen:
+    # ingestion -> processing -> training as a graph of tasks (src/task_graph.py). The 3 stages depend on each
+    # other, the work which can overlap runs inside processing and training (their own graphs). This graph
+    # gives the critical path report over the whole run.
+    graph = TaskGraph.from_config("training_pipeline", config)
+
     # 1. Data Ingestion
     # create data ingestion class object, read_yaml for reading yaml file
-    data_ingestion_obj = DataIngestion(yaml_file_reader(CONFIG_PATH))
-    data_ingestion_obj.run()
+    # the bucket object is remote, so instead of hashing the file we use its generation + md5 from the bucket
+    def ingestion():
+        data_ingestion_obj = DataIngestion(config)
+        outputs = [RAW_FILE_PATH, TRAIN_FILE_PATH, TEST_FILE_PATH]
+        cache.run(
+            "ingestion",
+            cache.fingerprint(config=config["data_ingestion"], format=ARTIFACT_FORMAT, remote=data_ingestion_obj.remote_version()),
+            outputs,
+            data_ingestion_obj.run,
+            force="ingestion" in forced,
+            # not downloaded again when the bucket object is unchanged (checked against raw_manifest.json)
+            may_keep=[RAW_FILE_PATH]
+        )
+        return outputs
 
     # 2. Data Preprocessing
-    data_processor = DataProcessor(TRAIN_FILE_PATH, TEST_FILE_PATH, PROCESSED_DIR, CONFIG_PATH)
-    data_processor.process()
+    def processing(split_files):
+        data_processor = DataProcessor(TRAIN_FILE_PATH, TEST_FILE_PATH, PROCESSED_DIR, CONFIG_PATH)
+        outputs = [PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, PREPROCESSOR_PATH, DRIFT_REFERENCE_PATH]
+        cache.run(
+            "processing",
+            cache.fingerprint([TRAIN_FILE_PATH, TEST_FILE_PATH], config=config["data_preprocessing"]),
+            outputs,
+            data_processor.process,
+            force="processing" in forced
+        )
+        return outputs
 
     # 3. Model Training
-    trainer = ModelTraining(PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, SAVED_MODEL_PATH)
-    trainer.run()
+    def training(processed_files):
+        trainer = ModelTraining(PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, SAVED_MODEL_PATH)
+        outputs = [SAVED_MODEL_PATH, COMPILED_MODEL_PATH]
+        cache.run(
+            "training",
+            cache.fingerprint(
+                [PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR],
+                params=LIGHGBM_PARAMS, mode=SEARCH_MODE, search=RANDOM_SEARCH_PARAMS, halving=HALVING_SEARCH_PARAMS,
+                balancing=config["data_preprocessing"]["balancing"],
+                categorical_mode=config["data_preprocessing"]["categorical_mode"]
+            ),
+            outputs,
+            trainer.run,
+            force="training" in forced
+        )
+        return outputs
+
+    graph.add("ingestion", ingestion, outputs=["split_files"])
+    graph.add("processing", processing, inputs=["split_files"], outputs=["processed_files"])
+    graph.add("training", training, inputs=["processed_files"], outputs=["model_files"])
+    graph.run()
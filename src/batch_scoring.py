@@ -0,0 +1,130 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import pandas as pd
+from src.logger import get_logger
+from src.custom_exception import CustomException
+from src.fast_predictor import FastPredictor
+from src.preprocessor import Preprocessor
+from config.paths import *
+from utils.common_functions import yaml_file_reader, read_in_chunks, ChunkWriter
+
+logger = get_logger(__name__)
+
+# Scores a whole file of bookings (e.g. the nightly forward booking book) without going through http.
+#   - the input is read chunk by chunk, memory stays at a few chunks however large the file is
+#   - every chunk gets the same transforms as in training, from the saved Preprocessor
+#     (label encoding, log1p of the skewed columns, projection to the selected features)
+#   - chunks are scored in a process pool, every worker loads the model + preprocessor ONCE in its initializer
+#   - results are written in input order, chunk by chunk, with the Booking_ID of every row
+
+# one copy per worker process, filled by init_worker
+worker_state = {}
+
+
+def load_scoring_model(model_format):
+    if model_format == "compiled" and os.path.exists(COMPILED_MODEL_PATH):
+        return FastPredictor.load(COMPILED_MODEL_PATH)
+    return joblib.load(SAVED_MODEL_PATH)
+
+
+def init_worker(model_format, threads_per_worker):
+    model = load_scoring_model(model_format)
+    if hasattr(model, "set_params"):
+        # LGBMClassifier would start one OpenMP thread per core in EVERY worker process
+        model.set_params(n_jobs=threads_per_worker)
+
+    worker_state["model"] = model
+    worker_state["preprocessor"] = Preprocessor.load(PREPROCESSOR_PATH)
+
+
+def score_chunk(chunk):
+    model = worker_state["model"]
+    preprocessor = worker_state["preprocessor"]
+
+    # same columns DataProcessor drops, Booking_ID is kept aside to identify the rows in the output
+    booking_ids = chunk["Booking_ID"].to_numpy() if "Booking_ID" in chunk.columns else None
+    chunk = chunk.drop(columns=[col for col in chunk.columns if col.startswith("Unnamed") or col == "Booking_ID"])
+
+    # unlike training, duplicated bookings are NOT dropped, every input row gets a prediction
+    features = preprocessor.to_matrix(chunk)
+    probabilities = model.predict_proba(features)
+
+    result = pd.DataFrame({
+        "probability": probabilities[:, 1],
+        "prediction": model.classes_[probabilities.argmax(axis=1)]
+    })
+    if booking_ids is not None:
+        result.insert(0, "Booking_ID", booking_ids)
+    return result
+
+
+class BatchScorer:
+
+    def __init__(self, input_path, output_path, config_path=CONFIG_PATH, n_workers=None, chunk_rows=None):
+        self.input_path = input_path
+        self.output_path = output_path
+
+        config = yaml_file_reader(config_path)
+        self.scoring_config = config["batch_scoring"]
+        self.raw_dtypes = config["data_ingestion"].get("raw_dtypes")
+
+        self.chunk_rows = chunk_rows or self.scoring_config["chunk_rows"]
+        self.n_workers = n_workers or self.scoring_config["n_workers"] or os.cpu_count()
+        self.model_format = self.scoring_config["model_format"]
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def score_in_process(self, chunks, writer):
+        # one worker -> no pool, no pickling of the chunks between processes
+        init_worker(self.model_format, None)
+        for chunk in chunks:
+            writer.write(score_chunk(chunk))
+
+    def score_in_pool(self, chunks, writer):
+        # at most 2 chunks per worker are in flight, so a huge input is never read into memory at once.
+        # futures are written in submission order, the output rows are in the same order as the input
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.n_workers)
+        with ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=init_worker,
+            initargs=(self.model_format, threads_per_worker)
+        ) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(score_chunk, chunk))
+                if len(pending) >= 2 * self.n_workers:
+                    writer.write(pending.popleft().result())
+
+            while pending:
+                writer.write(pending.popleft().result())
+
+    def run(self):
+        try:
+            logger.info(f"Starting batch scoring of {self.input_path} with {self.n_workers} workers and chunks of {self.chunk_rows} rows")
+            start = time.perf_counter()
+
+            if not os.path.exists(PREPROCESSOR_PATH):
+                raise FileNotFoundError(f"No preprocessor found at {PREPROCESSOR_PATH}, run the training pipeline first")
+
+            chunks = read_in_chunks(self.input_path, self.chunk_rows, self.raw_dtypes)
+            writer = ChunkWriter(self.output_path)
+            try:
+                if self.n_workers == 1:
+                    self.score_in_process(chunks, writer)
+                else:
+                    self.score_in_pool(chunks, writer)
+            finally:
+                writer.close()
+
+            elapsed = time.perf_counter() - start
+            logger.info(f"Scored {writer.n_rows} bookings in {elapsed:.2f}s ({writer.n_rows / elapsed:.0f} rows/s), predictions saved to {self.output_path}")
+            return writer.n_rows
+
+        except Exception as e:
+            logger.error(f"Error while batch scoring {e}")
+            raise CustomException("Failed to batch score the bookings", e)
@@ -1,10 +1,15 @@
 import os
+import json
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from google.cloud import storage
 from sklearn.model_selection import train_test_split
 from src.logger import get_logger
 from src.custom_exception import CustomException
-from utils.common_functions import yaml_file_reader
+from src.storage_backend import get_storage_backend
+from src.instrumentation import instrumented, current_step
+from utils.common_functions import yaml_file_reader, load_data, save_data, ChunkWriter
 from config.paths import *
 
 logger = get_logger(__name__)
@@ -18,21 +23,124 @@ class DataIngestion:
         self.bucket_name = self.config["bucket_name"]
         self.bucket_file_name = self.config["bucket_file_name"]
         self.train_ratio = self.config["train_ratio"]
+
+        # objects bigger than one chunk are downloaded as parallel byte ranges
+        self.chunk_size = int(self.config.get("download_chunk_mb", 32) * 1024 * 1024)
+        self.download_workers = self.config.get("download_workers", 8)
+
+        self.split_mode = self.config.get("split_mode", "memory")
+        self.split_chunk_rows = self.config.get("split_chunk_rows", 100000)
+        self.raw_dtypes = self.config.get("raw_dtypes")
+
+        # created on first use, so building the object does not need bucket credentials
+        self.backend = None
         
         # we want to store our return data from DataIngestion to raw directory in artifacts folder
         os.makedirs(RAW_DIR, exist_ok = True)
         logger.info(f"Data ingestion started with bucket name - {self.bucket_name} and file name is {self.bucket_file_name}")
 
+    def get_backend(self):
+        if self.backend is None:
+            self.backend = get_storage_backend(self.config)
+        return self.backend
+
+    def remote_version(self):
+        # generation + md5 of the object in the bucket, None when the bucket can not be reached
+        # the training pipeline puts this in the ingestion fingerprint, so new data in the bucket re runs ingestion
+        try:
+            return self.get_backend().metadata(self.bucket_file_name)
+        except Exception as e:
+            logger.error(f"Could not read the metadata of {self.bucket_file_name} - {e}")
+            return None
+
+    @staticmethod
+    def read_json(file_path):
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def write_json(content, file_path):
+        # write to a temp file and rename, so a crash never leaves half a json behind
+        with open(file_path + ".tmp", "w") as f:
+            json.dump(content, f)
+        os.replace(file_path + ".tmp", file_path)
+
+    @staticmethod
+    def local_md5(file_path):
+        md5 = hashlib.md5()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(chunk)
+        return base64.b64encode(md5.digest()).decode()
+
+    def download_in_chunks(self, remote, part_path):
+        # the object is split into byte ranges which are downloaded by a thread pool and written at their offset
+        # finished chunks are remembered in a small state file, so an interrupted download resumes where it stopped
+        state_path = part_path + ".json"
+        n_chunks = (remote["size"] + self.chunk_size - 1) // self.chunk_size
+
+        state = self.read_json(state_path)
+        resumable = (
+            state is not None and os.path.exists(part_path)
+            and state["remote"] == remote and state["chunk_size"] == self.chunk_size
+        )
+        done = set(state["done"]) if resumable else set()
+
+        if not resumable:
+            # allocate the full file once, every chunk is then written in place
+            with open(part_path, "wb") as f:
+                f.truncate(remote["size"])
+        else:
+            logger.info(f"Resuming download, {len(done)}/{n_chunks} chunks already downloaded")
+
+        def download_chunk(index):
+            start = index * self.chunk_size
+            end = min(start + self.chunk_size, remote["size"]) - 1
+            data = self.get_backend().read_range(self.bucket_file_name, start, end, remote["generation"])
+            with open(part_path, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+            return index
+
+        todo = [index for index in range(n_chunks) if index not in done]
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            futures = [executor.submit(download_chunk, index) for index in todo]
+            for future in as_completed(futures):
+                done.add(future.result())
+                self.write_json({"remote": remote, "chunk_size": self.chunk_size, "done": sorted(done)}, state_path)
+
+        os.remove(state_path)
+
     # We need to create another method which downloads data from GCP
+    # it only downloads when the object in the bucket is different from the one we downloaded last time
+    @instrumented("DataIngestion.download_csv_from_gcp")
     def download_csv_from_gcp(self):
         try:
-            client = storage.Client()
-            bucket = client.bucket(self.bucket_name)
-            #blob means file name
-            blob = bucket.blob(self.bucket_file_name)
-
-            # now we want the file to downloaded to raw_file_path
-            blob.download_to_filename(RAW_FILE_PATH)
+            remote = self.get_backend().metadata(self.bucket_file_name)
+            source = {"bucket": self.bucket_name, "file": self.bucket_file_name}
+
+            manifest = self.read_json(RAW_MANIFEST_PATH)
+            if (manifest is not None and os.path.exists(RAW_FILE_PATH)
+                    and manifest["source"] == source and manifest["remote"] == remote):
+                logger.info(f"{self.bucket_file_name} is unchanged (generation {remote['generation']}), skipping the download")
+                return
+
+            # download next to the real file and only rename at the end, so RAW_FILE_PATH is never half written
+            part_path = RAW_FILE_PATH + ".part"
+            if remote["size"] > self.chunk_size:
+                logger.info(f"Downloading {remote['size']} bytes in chunks of {self.chunk_size} bytes")
+                self.download_in_chunks(remote, part_path)
+            else:
+                self.get_backend().download(self.bucket_file_name, part_path)
+
+            if remote["md5"] is not None and self.local_md5(part_path) != remote["md5"]:
+                os.remove(part_path)
+                raise ValueError("md5 of the downloaded file does not match the bucket object")
+
+            os.replace(part_path, RAW_FILE_PATH)
+            self.write_json({"source": source, "remote": remote}, RAW_MANIFEST_PATH)
 
             logger.info(f"Raw CSV file is downloaded to {RAW_FILE_PATH}")
 
@@ -41,16 +149,21 @@ class DataIngestion:
             raise CustomException("Failed to download the csv file", e)
 
     # another method to split the data
+    @instrumented("DataIngestion.split_data")
     def split_data(self):
+        if self.split_mode == "streaming":
+            return self.split_data_streaming()
+
         try:
             logger.info("Starting to split the data")
-            data = pd.read_csv(RAW_FILE_PATH)
+            data = load_data(RAW_FILE_PATH, dtype=self.raw_dtypes)
+            current_step().rows = len(data)
 
             train_data, test_data = train_test_split(data, test_size = 1-self.train_ratio, random_state = 99)
 
-            # convert them to csv format
-            train_data.to_csv(TRAIN_FILE_PATH)
-            test_data.to_csv(TEST_FILE_PATH)
+            # save them in the artifact format from config.yaml (parquet by default)
+            save_data(train_data, TRAIN_FILE_PATH)
+            save_data(test_data, TEST_FILE_PATH)
             logger.info(f"Train data saved to {TRAIN_FILE_PATH}")
             logger.info(f"Test data saved to {TEST_FILE_PATH}")
 
@@ -66,6 +179,33 @@ class DataIngestion:
             # # Instead how we can call is
             # obj.run()
 
+    # streaming version of split_data for raw files which do not fit in memory
+    # every row is assigned by hashing its Booking_ID -> the split is reproducible and stable,
+    # a booking stays in the same split even when new rows are added to the export
+    def split_data_streaming(self):
+        try:
+            logger.info(f"Starting to split the data in chunks of {self.split_chunk_rows} rows")
+            train_writer = ChunkWriter(TRAIN_FILE_PATH)
+            test_writer = ChunkWriter(TEST_FILE_PATH)
+
+            for chunk in pd.read_csv(RAW_FILE_PATH, dtype=self.raw_dtypes, chunksize=self.split_chunk_rows):
+                # hash_pandas_object is vectorized and uses a fixed key, so the hash is the same on every run
+                hashes = pd.util.hash_pandas_object(chunk["Booking_ID"], index=False).to_numpy()
+                is_train = (hashes % 10000) < self.train_ratio * 10000
+
+                train_writer.write(chunk[is_train])
+                test_writer.write(chunk[~is_train])
+
+            train_writer.close()
+            test_writer.close()
+            current_step().rows = train_writer.n_rows + test_writer.n_rows
+            logger.info(f"Train data saved to {TRAIN_FILE_PATH}")
+            logger.info(f"Test data saved to {TEST_FILE_PATH}")
+
+        except Exception as e:
+            logger.error("Error while splitting the csv file in chunks")
+            raise CustomException("Failed splitting the csv file into train and test", e)
+
     def run(self):
 
         try:
@@ -76,6 +216,9 @@ class DataIngestion:
 
         except CustomException as ce:
             logger.error(f"CustomException : {str(ce)}")
+            # the caller (training pipeline, stage cache) has to know the ingestion failed,
+            # otherwise the old raw.csv and splits are used as if they were new
+            raise
 
         finally:
             logger.info("Data Ingestion Completed")
@@ -1,13 +1,21 @@
 import os
+import json
+import hashlib
 import pandas as pd
 import numpy as np
 from src.logger import get_logger
 from src.custom_exception import CustomException
+from src.preprocessor import Preprocessor
+from src.instrumentation import instrumented, current_step
+from src.task_graph import TaskGraph
+from src.drift_monitor import build_reference, save_reference
 from config.paths import *
-from utils.common_functions import yaml_file_reader, load_data
+from utils.common_functions import yaml_file_reader, load_data, save_data
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-from imblearn.over_sampling import SMOTE
+from sklearn.feature_selection import mutual_info_classif
+from sklearn.neighbors import NearestNeighbors
+import lightgbm as lgb
+from imblearn.over_sampling import SMOTE, SMOTENC
 
 logger = get_logger(__name__)
 
@@ -28,64 +36,104 @@ class DataProcessor:
         #for reading the file passed by config_path
         self.config = yaml_file_reader(config_path)
 
+        # We have to define all the categorical columns and numerical columns that we have 
+        # to extract from the yaml file
+        # the preprocessor holds everything we fit on the train data, it gets saved next to the model
+        self.preprocessor = Preprocessor(
+            self.config["data_preprocessing"]["categorical_columns"],
+            self.config["data_preprocessing"]["numerical_columns"],
+            self.config["data_preprocessing"]["skewnewss_threshold"]
+        )
+
         # first we need to create a processed_dir in artifacts folder where we save the processed df
         if not os.path.exists(self.processed_dir):
             os.makedirs(self.processed_dir)
             logger.info("Created Processed Directory")
 
-    def preprocess_data(self, df):
+    @instrumented("DataProcessor.preprocess_data", rows=len)
+    def preprocess_data(self, df, fit=False):
+        # fit=True only for the train split -> the encoders and skewed columns are learned once from train
+        # and the test split (and later the flask app) reuse them through self.preprocessor
 
         try:
             logger.info("Starting Data Preprocessing Steps")
 
             logger.info("Dropping Unnamed and Booking ID Columns and removing duplicates.")
-            df.drop(columns=['Unnamed: 0', 'Booking_ID'] , inplace=True)
+            # 'Unnamed: 0' only exists in old csv splits which were written with the index
+            df.drop(columns=['Unnamed: 0', 'Booking_ID'] , inplace=True, errors='ignore')
             df.drop_duplicates(inplace=True)
 
-            # We have to define all the categorical columns and numerical columns that we have 
-            # to extract from the yaml file
-
-            cat_cols = self.config["data_preprocessing"]["categorical_columns"]
-            num_cols = self.config["data_preprocessing"]["numerical_columns"]
-
-            # next we will do the label encoding
-            logger.info("Applying Label Encoding")
-
-            label_encoder = LabelEncoder()
-            mappings={}
-
-            for col in cat_cols:
-                df[col] = label_encoder.fit_transform(df[col])
-                 
-            mappings[col] = {label:code for label,code in zip(label_encoder.classes_ , label_encoder.transform(label_encoder.classes_))}
-            logger.info("Label Mappings are - ")
-            for col, mapping in mappings.items():
-                logger.info(f"{col}: {mapping}")
+            if fit:
+                logger.info("Learning Label Encodings and Skewed Columns from this split")
+                self.preprocessor.fit(df)
 
-            logger.info("Starting Skewness Handling")
-            skewness_threshold = self.config["data_preprocessing"]["skewnewss_threshold"]
-            skewness = df[num_cols].apply(lambda x:x.skew())
-
-            for column in skewness[skewness > skewness_threshold].index:
-                df[column] = np.log1p(df[column])
-
-            return df
+            logger.info("Applying Label Encoding and Skewness Handling")
+            return self.preprocessor.transform(df)
         
         except Exception as e:
             logger.error(f"Error during preprocess step {e}")
             raise CustomException("Error occured during preprocessing data - ", e)
         
 
+    @staticmethod
+    def downcast(df):
+        # int64 -> smallest int type which holds the values, float64 -> float32 only when no value changes
+        for col in df.columns:
+            if pd.api.types.is_integer_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], downcast="integer")
+            elif pd.api.types.is_float_dtype(df[col]):
+                as_float32 = df[col].astype(np.float32)
+                if (as_float32.astype(np.float64) == df[col]).all():
+                    df[col] = as_float32
+        return df
+
+    @instrumented("DataProcessor.balancing_data", rows=len)
     def balancing_data(self, df):
 
         try:
             logger.info("Handling Imbalanced Data")
+            balancing_config = self.config["data_preprocessing"]["balancing"]
+            method = balancing_config["method"]
+
+            if balancing_config["downcast"]:
+                memory_before = df.memory_usage(deep=True).sum()
+                df = self.downcast(df)
+                logger.info(f"Downcasted dtypes - {memory_before / 1e6:.1f} MB -> {df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+
+            if method == "class_weight":
+                # nothing is resampled here, ModelTraining trains with class_weight="balanced"
+                logger.info("Balancing with class weights during training, no synthetic rows created")
+                return df
+
             X = df.drop(columns='booking_status')
             y = df["booking_status"]
-            smote = SMOTE(random_state=42)
-            X_ressampled , y_resampled = smote.fit_resample(X,y)
-            balanced_df = pd.DataFrame(X_ressampled , columns=X.columns)
-            balanced_df["booking_status"] = y_resampled
+            # k_neighbors=5 -> 5 neighbours + the point itself, same as SMOTE's default but searched on n_jobs cores
+            neighbours = NearestNeighbors(n_neighbors=6, n_jobs=balancing_config["n_jobs"])
+            if self.config["data_preprocessing"]["categorical_mode"] == "native":
+                # SMOTE-NC gives synthetic rows the most common category of the neighbours instead of
+                # a fractional code in between two categories
+                categorical_features = [col for col in X.columns if col in self.preprocessor.categorical_columns]
+                smote = SMOTENC(categorical_features=categorical_features, random_state=42, k_neighbors=neighbours)
+            else:
+                smote = SMOTE(random_state=42, k_neighbors=neighbours)
+
+            if method == "smote":
+                X_ressampled , y_resampled = smote.fit_resample(X,y)
+            elif method == "smote_chunked":
+                order = np.random.RandomState(42).permutation(len(df))
+                parts = [
+                    smote.fit_resample(X.iloc[chunk], y.iloc[chunk])
+                    for chunk in np.array_split(order, max(1, len(df) // balancing_config["chunk_rows"]))
+                ]
+                X_ressampled = pd.concat([part[0] for part in parts], ignore_index=True)
+                y_resampled = pd.concat([part[1] for part in parts], ignore_index=True)
+            else:
+                raise ValueError(f"Unknown balancing method {method}")
+
+            # SMOTE already gives back a dataframe with our columns and dtypes, add the target to it
+            # instead of building one more copy of the whole oversampled data
+            balanced_df = X_ressampled
+            balanced_df["booking_status"] = y_resampled.to_numpy()
 
             logger.info("Data Balanced Successfully")
             return balanced_df
@@ -95,24 +143,71 @@ class DataProcessor:
             raise CustomException("Error occured during balancing data - ", e)
         
 
+    @instrumented("DataProcessor.rank_features")
+    def rank_features(self, X, y, seed):
+        # returns the features sorted by importance (most important first) with the configured method
+        selection_config = self.config["data_preprocessing"]["feature_selection"]
+        method = selection_config["method"]
+        n_jobs = selection_config["n_jobs"]
+        max_samples = selection_config["max_samples"]
+
+        if method == "random_forest":
+            # n_jobs -> trees are built on all cores, max_samples -> every tree only sees a sample of the rows
+            model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, max_samples=max_samples)
+            model.fit(X, y)
+            importance = model.feature_importances_
+
+        elif method == "lightgbm":
+            model = lgb.LGBMClassifier(random_state=seed, n_jobs=n_jobs, importance_type="gain", verbose=-1)
+            model.fit(X, y)
+            importance = model.feature_importances_
+
+        elif method == "mutual_info":
+            if max_samples:
+                sample = X.sample(frac=max_samples, random_state=seed).index
+                X, y = X.loc[sample], y.loc[sample]
+            discrete = [col in self.preprocessor.categorical_columns for col in X.columns]
+            importance = mutual_info_classif(X, y, discrete_features=discrete, random_state=seed, n_jobs=n_jobs)
+
+        else:
+            raise ValueError(f"Unknown feature selection method {method}")
+
+        return pd.Series(importance, index=X.columns).sort_values(ascending=False)
+
+    def data_fingerprint(self, df):
+        # hash of the balanced data + feature selection settings, if it did not change the old ranking is still valid
+        sha = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        sha.update(json.dumps(self.config["data_preprocessing"]["feature_selection"], sort_keys=True).encode())
+        sha.update(json.dumps(df.columns.tolist()).encode())
+        return sha.hexdigest()
+
+    @instrumented("DataProcessor.feature_selection", rows=len)
     def feature_selection(self, df):
 
         try:
             logger.info("Starting Feature Selection")
             X = df.drop(columns='booking_status')
             y = df["booking_status"]
-            model =  RandomForestClassifier(random_state=42)
-            model.fit(X,y)
-            feature_importance = model.feature_importances_
-            feature_importance_df = pd.DataFrame({
-                'feature':X.columns,
-                'importance':feature_importance
-                })
-            top_features_importance_df = feature_importance_df.sort_values(by="importance" , ascending=False)
-
             num_features_to_select = self.config["data_preprocessing"]["no_of_features"]
-            top_10_features = top_features_importance_df["feature"].head(num_features_to_select).values
-            top_10_df = df[top_10_features.tolist() + ["booking_status"]]
+
+            fingerprint = self.data_fingerprint(df)
+            cached = None
+            if os.path.exists(FEATURE_RANKING_PATH):
+                with open(FEATURE_RANKING_PATH, "r") as f:
+                    cached = json.load(f)
+
+            if cached is not None and cached["fingerprint"] == fingerprint:
+                logger.info("Data did not change since the last feature selection, reusing the saved ranking")
+                ranking = cached["ranking"]
+            else:
+                ranking = self.rank_features(X, y, seed=42).index.tolist()
+                self.check_stability(X, y, ranking[:num_features_to_select])
+
+                with open(FEATURE_RANKING_PATH, "w") as f:
+                    json.dump({"fingerprint": fingerprint, "ranking": ranking}, f, indent=2)
+
+            top_10_features = ranking[:num_features_to_select]
+            top_10_df = df[top_10_features + ["booking_status"]]
             
             logger.info("Feature Selection Completed Successfully")
             logger.info(f"Top 10 features are - {top_10_features}")
@@ -122,15 +217,28 @@ class DataProcessor:
         except Exception as e:
             logger.error(f"Error during perform feature selection {e}")
             raise CustomException("Error occured during feature selection step - ", e)
+
+    def check_stability(self, X, y, selected):
+        # a fast or sampled ranking is only useful if it is stable -> rank again with other seeds and
+        # compare the top features with the ones we selected
+        selection_config = self.config["data_preprocessing"]["feature_selection"]
+        for run in range(1, selection_config["stability_runs"] + 1):
+            top = self.rank_features(X, y, seed=42 + run).index[:len(selected)]
+            overlap = len(set(top) & set(selected)) / len(selected)
+            logger.info(f"Feature selection stability run {run} - overlap {overlap:.2f}")
+            if overlap < selection_config["stability_threshold"]:
+                logger.warning(f"Selected features are not stable, run {run} picked {list(top)} instead of {selected}")
         
 
-    # now we have our data in df format, we want to save it in csv format
+    # now we have our data in df format, we want to save it in the artifact format from config.yaml
 
-    def save_data_in_csv(self,df, file_path):
+    @instrumented("DataProcessor.save_processed_data")
+    def save_processed_data(self,df, file_path):
         try:
-            logger.info("Saving our data from dataframe format to csv format in processed folder")
+            logger.info("Saving our processed data from dataframe format to processed folder")
 
-            df.to_csv(file_path, index = False)
+            save_data(df, file_path)
+            current_step().rows = len(df)
 
             logger.info("Data Saved Successfully to given file path")
 
@@ -141,25 +249,65 @@ class DataProcessor:
 
     # just like how we combined all the step using def run(self), we will do the same here
 
+    @instrumented("DataProcessor.load_data", rows=len)
+    def load_split(self, file_path):
+        return load_data(file_path)
+
+    def save_preprocessor(self, train_df):
+        # remember the selected features (in model order) and save the fitted preprocessor for serving
+        self.preprocessor.selected_features = train_df.columns.drop("booking_status").tolist()
+        self.preprocessor.save(PREPROCESSOR_PATH)
+        return PREPROCESSOR_PATH
+
+    @instrumented("DataProcessor.save_drift_reference")
+    def save_drift_reference(self, train_df, selected_train_df):
+        # distribution of the selected features on the preprocessed train split BEFORE balancing,
+        # the synthetic SMOTE rows would not look like real bookings (see src/drift_monitor.py)
+        features = selected_train_df.columns.drop("booking_status").tolist()
+        reference = build_reference(train_df, features, self.config["data_preprocessing"]["drift_reference"]["n_bins"])
+        os.makedirs(os.path.dirname(DRIFT_REFERENCE_PATH), exist_ok=True)
+        save_reference(reference, DRIFT_REFERENCE_PATH)
+        logger.info(f"Drift reference of {len(features)} features saved to {DRIFT_REFERENCE_PATH}")
+        return DRIFT_REFERENCE_PATH
+
+    @instrumented("DataProcessor.process")
     def process(self):
         try:
             logger.info("Loading the data from raw directory")
-            
-            train_df = load_data(self.train_path)
-            test_df = load_data(self.test_path)
-
-            train_df = self.preprocess_data(train_df)
-            test_df = self.preprocess_data(test_df)
 
-            train_df = self.balancing_data(train_df)
-
-            train_df = self.feature_selection(train_df)
+            # the steps as a graph of tasks (src/task_graph.py):
+            #   load_train -> preprocess_train -> balance -> select_features -> save_train / save_preprocessor /
+            #                                                                    save_drift_reference
+            #   load_test  -----------------------> preprocess_test -> select_test -> save_test
+            # both splits are loaded at the same time, and the test split is preprocessed while SMOTE and
+            # feature selection run on the train split
+            graph = TaskGraph.from_config("DataProcessor.process", self.config)
+            graph.add("load_train", self.load_split, inputs=["train_path"], outputs=["train_raw"])
+            graph.add("load_test", self.load_split, inputs=["test_path"], outputs=["test_raw"])
+
+            # the encoders and skewed columns are learned on train, the test split has to wait for them
+            graph.add("preprocess_train", lambda df: (self.preprocess_data(df, fit=True), self.preprocessor),
+                      inputs=["train_raw"], outputs=["train_df", "fitted_preprocessor"])
+            graph.add("preprocess_test", lambda df, preprocessor: self.preprocess_data(df),
+                      inputs=["test_raw", "fitted_preprocessor"], outputs=["test_df"])
+
+            graph.add("balance", self.balancing_data, inputs=["train_df"], outputs=["balanced_df"])
+            graph.add("select_features", self.feature_selection, inputs=["balanced_df"], outputs=["selected_train_df"])
             # there can be different important features for train and test df
             # we will use the same df which are important for train_df
-            test_df = test_df[train_df.columns]
-
-            self.save_data_in_csv(train_df, PROCESSED_TRAIN_DIR)
-            self.save_data_in_csv(test_df, PROCESSED_TEST_DIR)
+            graph.add("select_test", lambda test_df, train_df: test_df[train_df.columns],
+                      inputs=["test_df", "selected_train_df"], outputs=["selected_test_df"])
+
+            graph.add("save_preprocessor", self.save_preprocessor, inputs=["selected_train_df"], outputs=["preprocessor_path"])
+            graph.add("save_drift_reference", self.save_drift_reference,
+                      inputs=["train_df", "selected_train_df"], outputs=["drift_reference_path"])
+            graph.add("save_train", self.save_processed_data, inputs=["selected_train_df", "processed_train_path"])
+            graph.add("save_test", self.save_processed_data, inputs=["selected_test_df", "processed_test_path"])
+
+            graph.run(
+                train_path=self.train_path, test_path=self.test_path,
+                processed_train_path=PROCESSED_TRAIN_DIR, processed_test_path=PROCESSED_TEST_DIR
+            )
 
             logger.info("Data Processing completed successfully.")
 
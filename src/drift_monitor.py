@@ -0,0 +1,127 @@
+import json
+import time
+import threading
+from datetime import datetime
+import numpy as np
+
+# Do the live bookings still look like the data the model was trained on?
+#
+# Training (DataProcessor) -> a reference distribution of every selected feature, on the preprocessed train
+# split (before SMOTE, the synthetic rows are not real bookings): n_bins quantile bins (edges + share of
+# rows per bin), saved as drift_reference.json next to the model.
+#
+# Serving -> every model has a DriftMonitor with a fixed size table of counts (features x bins). A request
+# only adds its rows to the table, vectorized for the whole batch: one comparison against the padded edge
+# matrix + one bincount, a few microseconds per request, no allocation that grows with traffic.
+# The counts live in time windows (window_seconds), scores are computed over the current + the previous
+# window, so old traffic drops out and the scores follow the recent inputs.
+#
+# Scores per feature, computed only when asked for (/metrics scrape, /admin/drift), never per request:
+#   psi -> population stability index, sum((live - ref) * ln(live / ref)) over the bins.
+#          rule of thumb: < 0.1 stable, 0.1 - 0.2 moderate shift, > 0.2 significant shift -> retrain
+#   ks  -> largest distance between the cumulative distributions of live and reference (on the bins)
+
+# empty bins would make psi infinite
+EPSILON = 1e-4
+
+
+def build_reference(df, features, n_bins=20):
+    # df - preprocessed train data (the same values the model gets as input)
+    reference = {"created_at": datetime.now().isoformat(timespec="seconds"), "n_rows": len(df), "features": {}}
+    for col in features:
+        # the app sends float32 to the model, bin the float32 values so an edge is never split by rounding
+        values = df[col].to_numpy(dtype=np.float32).astype(np.float64)
+        values = values[~np.isnan(values)]
+        # quantile edges -> every bin has about the same share of the train rows. Columns with only a few
+        # values (codes, counts) get fewer bins, duplicate edges are dropped
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]).astype(np.float32))
+        counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+        reference["features"][col] = {
+            "edges": edges.astype(np.float64).tolist(),
+            "proportions": (counts / max(1, counts.sum())).tolist()
+        }
+    return reference
+
+
+def save_reference(reference, file_path):
+    with open(file_path, "w") as f:
+        json.dump(reference, f, indent=2)
+
+
+def load_reference(file_path):
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+class DriftMonitor:
+
+    def __init__(self, reference, feature_columns, window_seconds=3600, min_rows=500):
+        # only the model's features which have a reference are monitored, in the model's column order
+        self.columns = [i for i, col in enumerate(feature_columns) if col in reference["features"]]
+        self.features = [feature_columns[i] for i in self.columns]
+        self.window_seconds = window_seconds
+        self.min_rows = min_rows
+        self.reference_created_at = reference.get("created_at")
+
+        edges = [np.asarray(reference["features"][col]["edges"], dtype=np.float32) for col in self.features]
+        n_bins = max(len(e) for e in edges) + 1 if edges else 1
+
+        # edges padded with +inf to one (features x max edges) matrix -> bin of x = number of edges <= x,
+        # for every feature at once. +inf is never <= x, the padded bins stay empty
+        self.edges = np.full((len(edges), n_bins - 1), np.inf, dtype=np.float32)
+        self.reference = np.zeros((len(edges), n_bins))
+        self.valid = np.zeros((len(edges), n_bins), dtype=bool)
+        for j, (col, feature_edges) in enumerate(zip(self.features, edges)):
+            self.edges[j, :len(feature_edges)] = feature_edges
+            self.reference[j, :len(feature_edges) + 1] = reference["features"][col]["proportions"]
+            self.valid[j, :len(feature_edges) + 1] = True
+
+        # bin i of feature j is counted at j * n_bins + i of one flat table
+        self.n_bins = n_bins
+        self.offsets = np.arange(len(edges)) * n_bins
+        self.current = np.zeros(len(edges) * n_bins, dtype=np.int64)
+        self.previous = np.zeros_like(self.current)
+        self.window_start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, features):
+        # features - the (rows x model features) float32 matrix sent to the model (a NaN lands in the first bin)
+        if not self.columns:
+            return
+        X = features[:, self.columns] if len(self.columns) != features.shape[1] else features
+        bins = (X[:, :, None] >= self.edges).sum(axis=2) + self.offsets
+        counts = np.bincount(bins.ravel(), minlength=self.current.size)
+
+        with self.lock:
+            if time.monotonic() - self.window_start >= self.window_seconds:
+                self.rotate()
+            self.current += counts
+
+    def rotate(self):
+        # called with the lock held, the current window becomes the previous one
+        self.previous, self.current = self.current, self.previous
+        self.current[:] = 0
+        self.window_start = time.monotonic()
+
+    def scores(self):
+        with self.lock:
+            counts = (self.current + self.previous).reshape(len(self.features), self.n_bins).astype(np.float64)
+
+        rows = int(counts[0].sum()) if len(counts) else 0
+        result = {"rows": rows, "reference_created_at": self.reference_created_at, "features": {}}
+        if rows < self.min_rows:
+            # too few rows for a stable score
+            return result
+
+        live = np.where(self.valid, counts / rows + EPSILON, 0.0)
+        reference = np.where(self.valid, self.reference + EPSILON, 0.0)
+        live /= live.sum(axis=1, keepdims=True)
+        reference /= reference.sum(axis=1, keepdims=True)
+
+        # padded bins are 0 on both sides -> ratio 1, they add nothing
+        ratio = np.divide(live, reference, out=np.ones_like(live), where=self.valid)
+        psi = ((live - reference) * np.log(ratio)).sum(axis=1)
+        ks = np.abs(np.cumsum(live, axis=1) - np.cumsum(reference, axis=1)).max(axis=1)
+        for col, feature_psi, feature_ks in zip(self.features, psi, ks):
+            result["features"][col] = {"psi": round(float(feature_psi), 6), "ks": round(float(feature_ks), 6)}
+        return result
@@ -0,0 +1,213 @@
+import threading
+import numpy as np
+
+# Loading the pickled LGBMClassifier at start up imports sklearn + lightgbm and unpickles the whole wrapper,
+# which is most of our cold start. For serving we only need the trees.
+# compile_lightgbm_model() flattens every tree of a trained model into a few numpy arrays (one entry per node),
+# they are saved in one .npz file, and FastPredictor walks all trees for all rows at once with numpy only.
+# This module must only import numpy, so the flask app can serve without sklearn / lightgbm.
+
+# same values as lightgbm's MissingType
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+# lightgbm treats |x| <= kZeroThreshold as zero for missing_type Zero
+ZERO_THRESHOLD = 1e-35
+
+# rows walked through the trees at once, the index arrays are rows x trees long -> memory stays at a few MB
+# whatever the size of the input
+BLOCK_ROWS = 2048
+
+
+def compile_lightgbm_model(model):
+    # model - fitted LGBMClassifier, returns a dict of numpy arrays which FastPredictor understands
+    booster = model.booster_
+    num_iteration = model.best_iteration_ or None
+    dump = booster.dump_model(num_iteration=num_iteration)
+
+    objective = dump["objective"].split()
+    if objective[0] != "binary" or dump["num_tree_per_iteration"] != 1:
+        raise ValueError(f"Only binary models can be compiled, got objective {dump['objective']}")
+    sigmoid = float(dict(part.split(":") for part in objective[1:]).get("sigmoid", 1.0))
+
+    feature, threshold, left, right = [], [], [], []
+    default_left, missing_type, categorical_row = [], [], []
+    categories, leaf_value, roots = [], [], []
+
+    def add(node):
+        # returns the index of the node, leaves are stored as ~leaf_index (always negative)
+        if "leaf_value" in node:
+            leaf_value.append(node["leaf_value"])
+            return ~(len(leaf_value) - 1)
+
+        index = len(feature)
+        feature.append(node["split_feature"])
+        default_left.append(node["default_left"])
+        missing_type.append(MISSING_TYPES[node["missing_type"]])
+        if node["decision_type"] == "==":
+            # categorical split -> threshold is "1||3||4", the categories which go left
+            threshold.append(0.0)
+            categorical_row.append(len(categories))
+            categories.append([int(category) for category in str(node["threshold"]).split("||")])
+        else:
+            threshold.append(node["threshold"])
+            categorical_row.append(-1)
+        left.append(0)
+        right.append(0)
+
+        left[index] = add(node["left_child"])
+        right[index] = add(node["right_child"])
+        return index
+
+    for tree in dump["tree_info"]:
+        roots.append(add(tree["tree_structure"]))
+
+    # one row per categorical split, True where that category goes left
+    n_categories = max((max(row) for row in categories), default=-1) + 1
+    category_left = np.zeros((len(categories), max(n_categories, 1)), dtype=bool)
+    for row, values in enumerate(categories):
+        category_left[row, values] = True
+
+    return {
+        "feature": np.array(feature, dtype=np.int32),
+        "threshold": np.array(threshold, dtype=np.float64),
+        "left": np.array(left, dtype=np.int32),
+        "right": np.array(right, dtype=np.int32),
+        "default_left": np.array(default_left, dtype=bool),
+        "missing_type": np.array(missing_type, dtype=np.int8),
+        "categorical_row": np.array(categorical_row, dtype=np.int32),
+        "category_left": category_left,
+        "leaf_value": np.array(leaf_value, dtype=np.float64),
+        "roots": np.array(roots, dtype=np.int32),
+        "sigmoid": np.float64(sigmoid),
+        "average_output": np.bool_(dump.get("average_output", False)),
+        "feature_names": np.array(dump["feature_names"]),
+        "classes": np.asarray(model.classes_)
+    }
+
+
+def save_compiled_model(compiled, file_path):
+    np.savez(file_path, **compiled)
+
+
+class FastPredictor:
+    # has the parts of the LGBMClassifier interface which application.py uses:
+    # predict, predict_proba, classes_, feature_name_
+
+    def __init__(self, compiled):
+        for name, value in compiled.items():
+            setattr(self, name, value)
+        self.classes_ = self.classes
+        self.feature_name_ = self.feature_names.tolist()
+        self.n_features_in_ = len(self.feature_name_)
+
+        # children[2 * node] is the left child and children[2 * node + 1] the right one -> one lookup per level
+        self.children = np.column_stack([self.left, self.right]).ravel()
+        # most models only have plain "x <= threshold" splits, then the missing value rules can be skipped
+        # as long as the input has no NaN
+        self.has_zero_missing = bool((self.missing_type == MISSING_ZERO).any())
+        self.has_categorical = bool((self.categorical_row >= 0).any())
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def go_left(self, node, value):
+        # full lightgbm decision rules, used when the input has NaN or the model has zero-missing / categorical splits
+        is_nan = np.isnan(value)
+        missing = self.missing_type[node]
+
+        # numerical split, same rules as lightgbm's NumericalDecision
+        numeric_value = np.where(is_nan & (missing != MISSING_NAN), 0.0, value)
+        is_missing = ((missing == MISSING_ZERO) & (np.abs(numeric_value) <= ZERO_THRESHOLD)) | ((missing == MISSING_NAN) & is_nan)
+        go_left = np.where(is_missing, self.default_left[node], numeric_value <= self.threshold[node])
+
+        # categorical split -> left when the category is in the node's set, NaN and negative go right
+        categorical_row = self.categorical_row[node]
+        is_categorical = categorical_row >= 0
+        if is_categorical.any():
+            category = np.where(is_nan, -1, value).astype(np.int64)
+            known = is_categorical & (category >= 0) & (category < self.category_left.shape[1])
+            in_set = np.zeros(len(node), dtype=bool)
+            in_set[known] = self.category_left[categorical_row[known], category[known]]
+            go_left = np.where(is_categorical, in_set, go_left)
+
+        return go_left
+
+    def raw_score(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected a matrix with {self.n_features_in_} features, got shape {X.shape}")
+
+        simple = not (self.has_zero_missing or self.has_categorical or np.isnan(X).any())
+        if len(X) <= BLOCK_ROWS:
+            return self.score_block(X, simple)
+        return np.concatenate([self.score_block(X[start:start + BLOCK_ROWS], simple)
+                               for start in range(0, len(X), BLOCK_ROWS)])
+
+    def score_block(self, X, simple):
+        n_trees = len(self.roots)
+
+        # current node of every (row, tree) pair in one flat array, all trees start at their root
+        nodes = np.tile(self.roots, len(X))
+        position = np.flatnonzero(nodes >= 0)
+        # where the row of each pair starts in the flattened X
+        row_offset = (position // n_trees) * self.n_features_in_
+        flat_X = X.ravel()
+
+        # one numpy step per tree level, only for the pairs which did not reach a leaf yet
+        while len(position):
+            node = nodes[position]
+            value = flat_X[row_offset + self.feature[node]]
+            go_left = value <= self.threshold[node] if simple else self.go_left(node, value)
+
+            next_nodes = self.children[2 * node + ~go_left]
+            nodes[position] = next_nodes
+            still_inside = next_nodes >= 0
+            position, row_offset = position[still_inside], row_offset[still_inside]
+
+        scores = self.leaf_value[~nodes].reshape(len(X), n_trees).sum(axis=1)
+        if self.average_output:
+            scores /= n_trees
+        return scores
+
+    def predict_proba(self, X):
+        positive = 1.0 / (1.0 + np.exp(-self.sigmoid * self.raw_score(X)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+
+class HybridPredictor:
+    # FastPredictor only wins on small batches: numpy's per call overhead is small, but its tree walk is
+    # slower than lightgbm's C++ predictor from about 100 rows on (2x slower at 1000 rows).
+    # Batches of up to max_rows rows -> compiled trees, larger batches -> the LGBMClassifier, which is only
+    # loaded (sklearn + lightgbm imports) by the first large batch, so start up still only needs numpy.
+    # load_booster - function() -> fitted LGBMClassifier of the same model
+
+    def __init__(self, compiled, load_booster, max_rows=100):
+        self.compiled = compiled
+        self.load_booster = load_booster
+        self.max_rows = max_rows
+        self.booster = None
+        self.lock = threading.Lock()
+        self.classes_ = compiled.classes_
+        self.feature_name_ = compiled.feature_name_
+        self.n_features_in_ = compiled.n_features_in_
+
+    def get_booster(self):
+        if self.booster is None:
+            with self.lock:
+                if self.booster is None:
+                    self.booster = self.load_booster()
+        return self.booster
+
+    def predict_proba(self, X):
+        if len(X) > self.max_rows:
+            return self.get_booster().predict_proba(X)
+        return self.compiled.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
@@ -0,0 +1,164 @@
+import os
+import joblib
+import pandas as pd
+import lightgbm as lgb
+import mlflow
+from src.logger import get_logger
+from src.custom_exception import CustomException
+from src.data_preprocessing import DataProcessor
+from src.model_training import ModelTraining
+from src.preprocessor import Preprocessor
+from src.instrumentation import instrumented, log_steps_to_mlflow
+from config.paths import *
+from utils.common_functions import yaml_file_reader, load_data, save_data
+
+logger = get_logger(__name__)
+
+# Incremental retraining -> only a few days of new bookings arrived, so instead of a new hyper parameter
+# search over the whole history we keep the current model and add a few boosting rounds fitted on the new rows:
+#   1. the new bookings (same columns as raw.csv) get exactly the training transforms from the saved
+#      preprocessor (same label codes, skewed columns and selected features) + the same balancing as DataProcessor
+#   2. lightgbm continues boosting from the saved model (init_model), the old trees stay as they are
+#   3. the new model is evaluated on the same held out test split as the full retrain
+#   4. quality gate -> compared with the metrics of the last FULL retrain logged in mlflow. If a gate metric
+#      dropped by more than max_metric_drop, the incremental model is thrown away and we fall back to a full
+#      retrain (search included) on the processed train data + the new rows
+
+class IncrementalTraining:
+
+    def __init__(self, new_data_path, config_path=CONFIG_PATH):
+        self.new_data_path = new_data_path
+        self.config = yaml_file_reader(config_path)
+        self.incremental_config = self.config["incremental_training"]
+
+        # evaluate_model, save_model, export_compiled_model and the full retrain are ModelTraining's
+        self.trainer = ModelTraining(PROCESSED_TRAIN_DIR, PROCESSED_TEST_DIR, SAVED_MODEL_PATH)
+
+        # the new rows are processed with the SAVED preprocessor, never fitted again
+        self.processor = DataProcessor(new_data_path, TEST_FILE_PATH, PROCESSED_DIR, config_path)
+        self.processor.preprocessor = Preprocessor.load(PREPROCESSOR_PATH)
+
+    @instrumented("IncrementalTraining.prepare_new_rows", rows=len)
+    def prepare_new_rows(self):
+        try:
+            new_df = load_data(self.new_data_path, dtype=self.config["data_ingestion"].get("raw_dtypes"))
+            logger.info(f"Loaded {len(new_df)} new bookings from {self.new_data_path}")
+
+            new_df = self.processor.preprocess_data(new_df)
+            if self.incremental_config["balance_new_rows"]:
+                new_df = self.processor.balancing_data(new_df)
+            return new_df
+
+        except Exception as e:
+            logger.error(f"Error while preparing the new rows {e}")
+            raise CustomException("Failed to prepare the new rows for incremental training", e)
+
+    @instrumented("IncrementalTraining.continue_boosting")
+    def continue_boosting(self, base_model, new_df):
+        try:
+            X_new = new_df.drop(columns=["booking_status"])[list(base_model.feature_name_)]
+            y_new = new_df["booking_status"]
+
+            # same hyper parameters as the saved model, only n_estimators new trees are added on top of its trees
+            model = lgb.LGBMClassifier(**{**base_model.get_params(), "n_estimators": self.incremental_config["n_estimators"]})
+            model.fit(X_new, y_new, init_model=base_model.booster_, categorical_feature=self.trainer.categorical_features(X_new))
+
+            logger.info(f"Continued boosting from {base_model.booster_.num_trees()} to {model.booster_.num_trees()} trees on {len(X_new)} rows")
+            return model
+
+        except Exception as e:
+            logger.error(f"Error while continuing boosting {e}")
+            raise CustomException("Failed to continue boosting from the saved model", e)
+
+    def last_full_retrain_metrics(self):
+        # metrics of the latest mlflow run which was a full retrain (tagged by ModelTraining.run)
+        try:
+            runs = mlflow.search_runs(
+                filter_string="tags.training_mode = 'full'", order_by=["attributes.start_time DESC"], max_results=1
+            )
+        except Exception as e:
+            logger.warning(f"Could not search the mlflow runs - {e}")
+            return None
+        if runs.empty:
+            return None
+
+        latest = runs.iloc[0]
+        metrics = {name: latest.get(f"metrics.{name}") for name in self.incremental_config["gate_metrics"]}
+        if any(pd.isna(value) for value in metrics.values()):
+            return None
+        logger.info(f"Last full retrain was mlflow run {latest['run_id']} with {metrics}")
+        return metrics
+
+    def passes_quality_gate(self, metrics, baseline):
+        max_drop = self.incremental_config["max_metric_drop"]
+        failed = {
+            name: (baseline[name], metrics[name])
+            for name in self.incremental_config["gate_metrics"]
+            if metrics[name] < baseline[name] - max_drop
+        }
+        if failed:
+            logger.warning(f"Incremental model is worse than the last full retrain (baseline, new) - {failed}")
+            return False
+        return True
+
+    @instrumented("IncrementalTraining.full_retrain")
+    def full_retrain(self, new_df):
+        # the new rows join the processed training data, then the normal ModelTraining run (search included)
+        try:
+            extension = os.path.splitext(PROCESSED_TRAIN_DIR)[1]
+            combined_path = os.path.join(PROCESSED_DIR, f"incremental_train{extension}")
+            train_df = load_data(PROCESSED_TRAIN_DIR)
+            combined = pd.concat([train_df, new_df[train_df.columns]], ignore_index=True)
+            save_data(combined, combined_path)
+
+            logger.info(f"Falling back to a full retrain on {len(combined)} rows")
+            ModelTraining(combined_path, PROCESSED_TEST_DIR, SAVED_MODEL_PATH).run()
+
+        except Exception as e:
+            logger.error(f"Error during the fallback full retrain {e}")
+            raise CustomException("Failed to fall back to a full retrain", e)
+
+    def run(self):
+        try:
+            logger.info("Starting incremental training")
+            new_df = self.prepare_new_rows()
+            base_model = joblib.load(SAVED_MODEL_PATH)
+            _, _, X_test, y_test = self.trainer.load_split_data()
+            baseline = self.last_full_retrain_metrics()
+            if baseline is None:
+                # no full retrain in mlflow yet -> the model we start from has to be matched at least
+                logger.info("No full retrain found in mlflow, using the current model's metrics as the baseline")
+                baseline = self.trainer.evaluate_model(base_model, X_test, y_test)
+
+            with mlflow.start_run():
+                mlflow.set_tag("training_mode", "incremental")
+                log_steps_to_mlflow()
+
+                model = self.continue_boosting(base_model, new_df)
+                metrics = self.trainer.evaluate_model(model, X_test, y_test)
+                mlflow.log_params({
+                    "new_data_path": self.new_data_path,
+                    "new_rows": len(new_df),
+                    "added_trees": self.incremental_config["n_estimators"],
+                    "total_trees": model.booster_.num_trees()
+                })
+                mlflow.log_metrics(metrics)
+
+                passed = self.passes_quality_gate(metrics, baseline)
+                mlflow.set_tag("quality_gate", "passed" if passed else "failed")
+
+                if passed:
+                    self.trainer.save_model(model)
+                    self.trainer.export_compiled_model(model, X_test)
+                    mlflow.log_artifact(SAVED_MODEL_PATH)
+                    mlflow.log_artifact(self.trainer.compiled_model_path)
+                    logger.info("Incremental training completed successfully")
+                    return "incremental"
+
+            # outside the incremental run, the full retrain logs its own mlflow run
+            self.full_retrain(new_df)
+            return "full"
+
+        except Exception as e:
+            logger.error(f"Error in incremental training - {e}")
+            raise CustomException("Failed during incremental training", e)
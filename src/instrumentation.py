@@ -0,0 +1,245 @@
+import sys
+import time
+import functools
+import threading
+from contextlib import contextmanager
+import yaml
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Step level instrumentation for the pipeline classes -> which step (csv load, label encoding, SMOTE,
+# feature selection, every search candidate ...) takes the time and the memory.
+#
+#   @instrumented("DataProcessor.balancing_data", rows=len)     -> decorator, rows computed from the return value
+#   def balancing_data(self, df): ...
+#
+#   with instrument("DataProcessor.load_data") as step:         -> context manager for a part of a method
+#       df = load_data(...)
+#       step.rows = len(df)
+#
+# Every finished step:
+#   - is logged as one line + the record in extra={"step_metrics": ...} (json log handlers keep it as fields)
+#   - is appended to step_records
+#   - is logged as mlflow metrics <step>.duration_s / .peak_rss_mb / .rows when an mlflow run is active.
+#     Steps which finish before the run starts (ingestion, processing) are sent by log_steps_to_mlflow()
+#
+# Disabled in config.yaml (instrumentation -> enabled: false) every decorated call is one extra function call.
+#
+# Peak memory is the peak RSS of the whole process during the step (VmHWM, reset through /proc/self/clear_refs
+# at the start of every step, linux only). Nested steps are handled. The counter is process wide, so while
+# steps run at the same time in different threads (a concurrent TaskGraph, inside concurrent_steps()) it is
+# never reset, one step would wipe the peak of the others. Those steps report the peak of the whole process
+# since the last reset, an upper bound of their own.
+
+step_records = []
+_settings = None
+_local = threading.local()
+_records_lock = threading.Lock()
+_mlflow_logged = 0
+_mlflow_steps = {}
+# number of concurrent sections running right now (nested graphs -> more than 1)
+_concurrent = 0
+_concurrent_lock = threading.Lock()
+
+
+def settings():
+    global _settings
+    if _settings is None:
+        try:
+            from config.paths import CONFIG_PATH
+            with open(CONFIG_PATH, "r") as config_file:
+                _settings = yaml.safe_load(config_file).get("instrumentation") or {}
+        except Exception:
+            _settings = {}
+        _settings.setdefault("enabled", True)
+        _settings.setdefault("track_memory", True)
+    return _settings
+
+
+def configure(enabled=None, track_memory=None):
+    # override config.yaml from code, e.g. benchmarks or a notebook
+    current = settings()
+    if enabled is not None:
+        current["enabled"] = enabled
+    if track_memory is not None:
+        current["track_memory"] = track_memory
+
+
+######## memory ########
+
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+@contextmanager
+def concurrent_steps():
+    # steps started inside run next to each other -> no peak reset until the last concurrent section ends
+    global _concurrent
+    with _concurrent_lock:
+        _concurrent += 1
+    try:
+        yield
+    finally:
+        with _concurrent_lock:
+            _concurrent -= 1
+
+
+######## steps ########
+
+class NullStep:
+    # returned when instrumentation is disabled, `step.rows = ...` is simply ignored
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STEP = NullStep()
+
+
+class Step:
+
+    def __init__(self, name, track_memory):
+        self.name = name
+        self.rows = None
+        self.track_memory = track_memory
+        self.peak = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+
+        if self.track_memory:
+            # the peak so far belongs to the enclosing step, keep it before resetting the counter
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak_rss_mb())
+            if not _concurrent:
+                reset_peak_rss()
+
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+
+        record = {"step": self.name, "duration_s": round(duration, 4)}
+        if self.track_memory:
+            self.peak = max(self.peak, peak_rss_mb())
+            record["peak_rss_mb"] = round(self.peak, 1)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        if self.rows is not None:
+            record["rows"] = int(self.rows)
+        if exc_type is not None:
+            record["failed"] = True
+
+        add_record(record)
+        return False
+
+
+def instrument(name):
+    current = settings()
+    if not current["enabled"]:
+        return NULL_STEP
+    return Step(name, current["track_memory"])
+
+
+def instrumented(name=None, rows=None):
+    # rows -> optional function(return value) -> number of rows, e.g. len for a dataframe
+    def decorator(fn):
+        step_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings()["enabled"]:
+                return fn(*args, **kwargs)
+
+            with instrument(step_name) as step:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    step.rows = rows(result)
+                return result
+
+        return wrapper
+    return decorator
+
+
+def current_step():
+    # innermost running step of this thread, lets a decorated method report its rows: current_step().rows = len(df)
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else NULL_STEP
+
+
+def record(name, duration_s, rows=None, quiet=False):
+    # for timings measured elsewhere, e.g. the fit time of every search candidate from cv_results_
+    if not settings()["enabled"]:
+        return
+    step_record = {"step": name, "duration_s": round(float(duration_s), 4)}
+    if rows is not None:
+        step_record["rows"] = int(rows)
+    add_record(step_record, quiet=quiet)
+
+
+def add_record(step_record, quiet=False):
+    with _records_lock:
+        step_records.append(step_record)
+
+    if not quiet:
+        details = ", ".join(f"{key}={value}" for key, value in step_record.items() if key != "step")
+        logger.info(f"Step {step_record['step']} finished - {details}", extra={"step_metrics": step_record})
+
+    # mlflow is only used when the pipeline already imported it, the flask app never pays for the import
+    mlflow = sys.modules.get("mlflow")
+    if mlflow is not None and mlflow.active_run() is not None:
+        log_steps_to_mlflow()
+
+
+def log_steps_to_mlflow():
+    # sends every record which was not sent yet to the active mlflow run
+    # a step which runs more than once (preprocess_data on train and test) becomes a metric history
+    global _mlflow_logged
+    mlflow = sys.modules.get("mlflow")
+    if mlflow is None or mlflow.active_run() is None:
+        return
+
+    with _records_lock:
+        pending = step_records[_mlflow_logged:]
+        _mlflow_logged = len(step_records)
+
+    for step_record in pending:
+        name = step_record["step"]
+        index = _mlflow_steps[name] = _mlflow_steps.get(name, -1) + 1
+        mlflow.log_metrics(
+            {f"{name}.{key}": value for key, value in step_record.items() if key not in ("step", "failed")},
+            step=index
+        )
@@ -1,36 +1,269 @@
 """
-The logger.py file in an ML Ops project is typically used to configure logging for 
-tracking and debugging different stages of the ML pipeline, such as data processing, 
-model training, and deployment. Instead of using print statements, logging provides a 
+The logger.py file in an ML Ops project is typically used to configure logging for
+tracking and debugging different stages of the ML pipeline, such as data processing,
+model training, and deployment. Instead of using print statements, logging provides a
 structured and configurable way to capture important runtime information.
 """
 
 import logging # used for logging purpose
-import os 
+import logging.handlers
+import os
+import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
+import yaml
 
 # create logs dir
 LOGS_DIR = "logs"
 os.makedirs(LOGS_DIR, exist_ok= True)
 # Now we created the folder for the logs directory
 
-# Now we have to create log files for particular date in the logs dir
-# This will be path file name
-LOG_FILE = os.path.join(LOGS_DIR, f"log_{datetime.now().strftime("%Y-%m-%d")}.log")
+# Settings come from config.yaml -> logging. They are read with yaml directly because everything else
+# (yaml_file_reader included) logs through this file
+try:
+    with open("config/config.yaml", "r") as config_file:
+        LOGGING_CONFIG = yaml.safe_load(config_file).get("logging") or {}
+except (OSError, yaml.YAMLError):
+    LOGGING_CONFIG = {}
+
+# One log file which is rotated by size (logs/app.log, app.log.1, ...) or by time (app.log.2025-01-31)
+# instead of a new log_<date>.log file every day
+LOG_FILE = os.path.join(LOGS_DIR, LOGGING_CONFIG.get("file_name", "app.log"))
 
 # Configuration of logging
 # param - 1 - filename
 #       -2 - format(what time it is created, level name, message)level - info, warning, error
 #       when we set level to logging.info() only info and levels above it will be shown, all other levels will not be shown
 #    -3 message
-logging.basicConfig(
-    filename= LOG_FILE,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_LEVEL = getattr(logging, str(LOGGING_CONFIG.get("level", "INFO")).upper())
+
+
+# json -> one object per line, easy to ship to a log store and query by field.
+# step records from src/instrumentation.py (extra={"step_metrics": ...}) become fields of the line
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        step_metrics = getattr(record, "step_metrics", None)
+        if step_metrics is not None:
+            entry["step_metrics"] = step_metrics
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# The same message from the same line over and over (a warning per chunk, a line per request) is let through
+# max_per_interval times per interval, the rest is dropped. The first message of the next interval says how
+# many were dropped. ERROR and above are never dropped, neither are the step records of src/instrumentation.py
+# (extra={"step_metrics": ...}), they all come from the same line but every one of them is a different step
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self, max_per_interval=20, interval_seconds=60):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval = interval_seconds
+        # (file, line, level) -> [window start, messages in this window, dropped in the last windows]
+        self.windows = {}
+        # every thread which logs runs the filter
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or getattr(record, "step_metrics", None) is not None:
+            return True
+
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                self.windows[key] = [now, 1, 0]
+                return True
+
+            if now - window[0] >= self.interval:
+                window[0], window[1] = now, 0
+                if window[2]:
+                    record.msg = f"{record.msg} (dropped {window[2]} similar messages)"
+                    window[2] = 0
+
+            window[1] += 1
+            if window[1] > self.max_per_interval:
+                window[2] += 1
+                return False
+            return True
+
+
+# File handler which only flushes once per batch of records instead of after every record
+class BatchFlushMixin:
+    in_batch = False
+
+    def flush(self):
+        if not self.in_batch:
+            super().flush()
+
+
+class BatchRotatingFileHandler(BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+# Never rotates, reopens the file when something else moved it away (logrotate, or the process which
+# rotates). Safe with many processes writing to the same file
+class BatchWatchedFileHandler(BatchFlushMixin, logging.handlers.WatchedFileHandler):
+    pass
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+# queue mode -> the calling thread only puts the record on an in memory queue (no file i/o in a request or
+# a pipeline step), one background thread takes everything waiting on the queue and writes it as one batch
+class BatchQueueListener:
+
+    def __init__(self, record_queue, handler, max_batch=1000):
+        self.queue = record_queue
+        self.handler = handler
+        self.max_batch = max_batch
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+
+            batch = [record]
+            while len(batch) < self.max_batch:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    # stop() was called, write what we already have and then stop
+                    self.queue.put(None)
+                    break
+                batch.append(record)
+
+            self.handler.in_batch = True
+            try:
+                for record in batch:
+                    if record.levelno >= self.handler.level:
+                        self.handler.handle(record)
+            finally:
+                self.handler.in_batch = False
+                self.handler.flush()
+
+    def stop(self):
+        # called at exit, everything which is still on the queue gets written
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+
+# Rotating handlers are not safe with several processes on one file: every process keeps its own size count /
+# rollover time and renames the file under the others, records get lost or end up in the wrong file.
+#   - only the process which imported this module first rotates, a forked child (multiprocessing worker)
+#     writes through a BatchWatchedFileHandler which follows the renames of the parent
+#   - gunicorn (every worker forked from the master) sets LOG_ROTATION=none -> nobody rotates in process,
+#     logrotate does it outside. LOG_TARGET=stderr sends everything to gunicorn's stderr instead of the file
+LOG_TARGET = os.environ.get("LOG_TARGET") or LOGGING_CONFIG.get("target", "file")
+LOG_ROTATION = os.environ.get("LOG_ROTATION") or LOGGING_CONFIG.get("rotation", "size")
+
+
+def build_file_handler(rotation=LOG_ROTATION):
+    if LOG_TARGET == "stderr":
+        handler = BatchStreamHandler()
+    elif rotation == "time":
+        handler = BatchTimedRotatingFileHandler(
+            LOG_FILE, when=LOGGING_CONFIG.get("when", "midnight"), backupCount=LOGGING_CONFIG.get("backup_count", 7)
+        )
+    elif rotation == "size":
+        handler = BatchRotatingFileHandler(
+            LOG_FILE, maxBytes=LOGGING_CONFIG.get("max_bytes", 10 * 1024 * 1024), backupCount=LOGGING_CONFIG.get("backup_count", 7)
+        )
+    else:
+        # none -> rotated outside of python
+        handler = BatchWatchedFileHandler(LOG_FILE)
+    handler.setFormatter(JsonFormatter() if LOGGING_CONFIG.get("format", "text") == "json" else logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+file_handler = build_file_handler()
+root_logger = logging.getLogger()
+root_logger.setLevel(LOG_LEVEL)
+
+
+def reopen_file_handler_in_child():
+    # after a fork -> the child stops rotating, the parent stays the only process which rotates the file
+    global file_handler
+    if isinstance(file_handler, logging.handlers.BaseRotatingHandler):
+        # closes only the child's copy of the file descriptor
+        file_handler.close()
+        file_handler = build_file_handler(rotation="none")
+    return file_handler
+
+
+if LOGGING_CONFIG.get("mode", "queue") == "queue":
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    log_listener = BatchQueueListener(log_queue, file_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    main_handler = queue_handler
+
+    def restart_log_listener():
+        # the writer thread does not survive a fork (gunicorn workers, multiprocessing),
+        # the child gets its own queue and writer thread
+        global log_queue, log_listener
+        log_queue = queue.SimpleQueue()
+        queue_handler.queue = log_queue
+        log_listener = BatchQueueListener(log_queue, reopen_file_handler_in_child())
+        log_listener.start()
+        atexit.register(log_listener.stop)
+
+    os.register_at_fork(after_in_child=restart_log_listener)
+else:
+    # sync -> the old behaviour, every record is written on the calling thread
+    main_handler = file_handler
+
+    def swap_file_handler():
+        global main_handler
+        rotating_handler = main_handler
+        main_handler = reopen_file_handler_in_child()
+        if main_handler is not rotating_handler:
+            for log_filter in rotating_handler.filters:
+                main_handler.addFilter(log_filter)
+            root_logger.removeHandler(rotating_handler)
+            root_logger.addHandler(main_handler)
+
+    os.register_at_fork(after_in_child=swap_file_handler)
+
+rate_limit = LOGGING_CONFIG.get("rate_limit") or {}
+if rate_limit.get("enabled", True):
+    main_handler.addFilter(RateLimitFilter(rate_limit.get("max_per_interval", 20), rate_limit.get("interval_seconds", 60)))
+
+root_logger.addHandler(main_handler)
 
 def get_logger(name):
     logger = logging.getLogger(name)
     # This will create logging with the given name by the user
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
     return logger
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+import queue
+from concurrent.futures import Future
+import numpy as np
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Most callers send only one booking per http request. Calling predict_proba once per booking means
+# we pay lightgbm's fixed per call cost (input checks, thread start up) for every single row.
+# The micro batcher sits between the flask routes and the model:
+#   - every request puts its row on a queue and gets back a Future
+#   - one background thread takes rows off the queue until max_batch_size rows are collected
+#     or max_wait_ms has passed since the first row arrived
+#   - the whole batch is scored with ONE predict_proba call and each Future gets its own row back
+
+class MicroBatcher:
+
+    def __init__(self, predict_fn, n_features, max_batch_size=256, max_wait_ms=2.0):
+        # predict_fn - function which takes a (n_rows, n_features) matrix and returns one output row per input row
+        self.predict_fn = predict_fn
+        self.n_features = n_features
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # batch size histogram buckets -> 1, 2, 4, ... up to max_batch_size
+        self.bucket_bounds = [2 ** i for i in range(max_batch_size.bit_length())]
+        if self.bucket_bounds[-1] < max_batch_size:
+            self.bucket_bounds.append(max_batch_size)
+
+        self.start_lock = threading.Lock()
+        self.pid = None
+        self._start()
+
+    def _start(self):
+        # threads do not survive a fork -> when gunicorn forks workers after loading the app (preload_app),
+        # every worker process starts its own queue and background thread on its first request
+        self.queue = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self._reset_stats()
+
+        self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.worker.start()
+        self.pid = os.getpid()
+        logger.info(f"Micro batcher started in process {self.pid} with max_batch_size={self.max_batch_size} and max_wait_ms={1000 * self.max_wait}")
+
+    def _ensure_started(self):
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self._start()
+
+    def _reset_stats(self):
+        self.n_batches = 0
+        self.n_rows = 0
+        self.n_errors = 0
+        self.batch_size_counts = [0] * len(self.bucket_bounds)
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def submit(self, row):
+        # row - one booking as a 1d array of n_features values
+        row = np.asarray(row, dtype=np.float32)
+        if row.shape != (self.n_features,):
+            raise ValueError(f"Expected a row of {self.n_features} features, got shape {row.shape}")
+
+        self._ensure_started()
+        future = Future()
+        self.queue.put((row, future, time.perf_counter()))
+        return future
+
+    def predict(self, row, timeout=None):
+        # blocking helper for the routes -> submit and wait for our own row
+        return self.submit(row).result(timeout=timeout)
+
+    def _collect_batch(self):
+        # block until at least one row arrives, then keep collecting until the window closes
+        batch = [self.queue.get()]
+        if batch[0] is None:
+            return None
+
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # close() was called, score what we already have and stop after this batch
+                self.queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            features = np.empty((len(batch), self.n_features), dtype=np.float32)
+            for i, (row, _, _) in enumerate(batch):
+                features[i] = row
+
+            started = time.perf_counter()
+            try:
+                outputs = self.predict_fn(features)
+                for i, (_, future, _) in enumerate(batch):
+                    future.set_result(outputs[i])
+                failed = False
+            except Exception as e:
+                logger.error(f"Error while scoring micro batch of {len(batch)} rows - {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+
+            self._record_batch(batch, started, failed)
+
+    def _record_batch(self, batch, started, failed):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        bucket = next(i for i, bound in enumerate(self.bucket_bounds) if len(batch) <= bound)
+
+        with self.stats_lock:
+            self.n_batches += 1
+            self.n_rows += len(batch)
+            self.n_errors += int(failed)
+            self.batch_size_counts[bucket] += 1
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, max(waits))
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "batches": self.n_batches,
+                "rows": self.n_rows,
+                "errors": self.n_errors,
+                "avg_batch_size": self.n_rows / self.n_batches if self.n_batches else 0.0,
+                "batch_size_histogram": {
+                    f"le_{bound}": count for bound, count in zip(self.bucket_bounds, self.batch_size_counts)
+                },
+                "avg_wait_ms": 1000 * self.total_wait / self.n_rows if self.n_rows else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seen
+            }
+
+    def close(self, timeout=None):
+        # None on the queue tells the worker to stop once everything before it is scored
+        self.queue.put(None)
+        self.worker.join(timeout)
+        logger.info("Micro batcher stopped")
@@ -0,0 +1,223 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.logger import get_logger
+from src.model_reloader import ModelReloader
+
+logger = get_logger(__name__)
+
+# One serving process for many models (one per hotel group / region) instead of one container per model,
+# which mostly holds a copy of the same python + lightgbm runtime. A request names its model with model_id:
+#   - a model (+ its preprocessor) is loaded the first time it is asked for, not at start up
+#   - the loaded models are kept in an LRU bounded by number of models AND estimated memory, the least
+#     recently used model is evicted when a new one does not fit
+#   - pinned models are loaded at start up and never evicted (the default model is always pinned)
+#   - every loaded model has its own ModelReloader, so each model file is still hot reloaded on its own
+#   - load time, hits, misses and evictions are counted per model (GET /admin/models)
+# Requests for a model which is already loaded only take a short lock to update the LRU order. Loading a
+# model does not block requests for the other models, two requests for the same cold model load it once.
+
+# model ids become folder names, nothing like "../" can get in
+MODEL_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+MB = 1024 * 1024
+
+
+class UnknownModelError(KeyError):
+    pass
+
+
+def model_memory_bytes(model, model_path):
+    # estimate, for a pickled LGBMClassifier the size of the file is the best cheap guess,
+    # the compiled model is only numpy arrays -> their exact size (a HybridPredictor counts its compiled trees,
+    # the LGBMClassifier it loads for large batches later is not counted)
+    model = getattr(model, "compiled", model)
+    if hasattr(model, "booster_"):
+        return os.path.getsize(model_path)
+    return sum(value.nbytes for value in vars(model).values() if isinstance(value, np.ndarray))
+
+
+class RegistryEntry:
+
+    def __init__(self, reloader, load_seconds, memory_bytes, pinned):
+        self.reloader = reloader
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.pinned = pinned
+        self.hits = 0
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+
+    def __init__(self, load_fn, resolve_path, max_models=8, max_memory_mb=1024, pinned=(),
+                 hot_reload=False, poll_seconds=5.0, on_swap=None, on_evict=None):
+        # load_fn      - function(model_id, model_path, version) -> warmed up ServingModel
+        # resolve_path - function(model_id) -> path of the model file, raises UnknownModelError when there is none
+        # on_evict     - optional function(model_id, serving_model) called after a model left the registry
+        self.load_fn = load_fn
+        self.resolve_path = resolve_path
+        self.max_models = max_models
+        self.max_memory_bytes = max_memory_mb * MB if max_memory_mb else None
+        self.pinned = set(pinned)
+        self.hot_reload = hot_reload
+        self.poll_seconds = poll_seconds
+        self.on_swap = on_swap
+        self.on_evict = on_evict
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+
+        # counters of every model id with a model file which was ever asked for, they survive an eviction
+        self.model_stats = {}
+
+        for model_id in self.pinned:
+            self.get(model_id)
+
+    def counters(self, model_id):
+        stats = self.model_stats.get(model_id)
+        if stats is None:
+            stats = self.model_stats[model_id] = {
+                "hits": 0, "misses": 0, "loads": 0, "evictions": 0, "load_failures": 0,
+                "last_load_seconds": None, "total_load_seconds": 0.0
+            }
+        return stats
+
+    def get(self, model_id):
+        # model_id comes from the json body, it can be a number or a list as well
+        if not isinstance(model_id, str) or not MODEL_ID_PATTERN.match(model_id):
+            raise UnknownModelError(f"Invalid model id {model_id!r}")
+
+        with self.lock:
+            entry = self.entries.get(model_id)
+            if entry is not None:
+                self.entries.move_to_end(model_id)
+                entry.hits += 1
+                entry.last_used = time.time()
+                self.counters(model_id)["hits"] += 1
+                serving_model = entry.reloader.current
+
+        if entry is not None:
+            if self.hot_reload:
+                entry.reloader.ensure_started()
+            return serving_model
+
+        # only ids which have a model file get a load lock and counters, random ids (404) leave nothing behind
+        model_path = self.resolve_path(model_id)
+        with self.lock:
+            load_lock = self.load_locks.setdefault(model_id, threading.Lock())
+        return self.load(model_id, model_path, load_lock)
+
+    def load(self, model_id, model_path, load_lock):
+        with load_lock:
+            # another request may have loaded it while we were waiting for the lock
+            with self.lock:
+                entry = self.entries.get(model_id)
+                if entry is not None:
+                    self.entries.move_to_end(model_id)
+                    self.counters(model_id)["hits"] += 1
+                    return entry.reloader.current
+                self.counters(model_id)["misses"] += 1
+
+            started = time.perf_counter()
+            try:
+                reloader = ModelReloader(
+                    lambda path, version: self.load_fn(model_id, path, version),
+                    model_path,
+                    poll_seconds=self.poll_seconds,
+                    on_swap=self.on_swap
+                )
+            except Exception:
+                with self.lock:
+                    self.counters(model_id)["load_failures"] += 1
+                raise
+            load_seconds = time.perf_counter() - started
+            serving_model = reloader.current
+            entry = RegistryEntry(reloader, load_seconds, model_memory_bytes(serving_model.model, model_path), model_id in self.pinned)
+
+            with self.lock:
+                self.entries[model_id] = entry
+                stats = self.counters(model_id)
+                stats["loads"] += 1
+                stats["last_load_seconds"] = round(load_seconds, 4)
+                stats["total_load_seconds"] += load_seconds
+                evicted = self.evict(keep=model_id)
+
+            logger.info(f"Loaded model {model_id} version {serving_model.version} in {load_seconds:.3f}s "
+                        f"({entry.memory_bytes / MB:.1f} MB), {len(self.entries)} models loaded")
+            for evicted_id, evicted_entry in evicted:
+                evicted_entry.reloader.stop()
+                logger.info(f"Evicted model {evicted_id} (least recently used)")
+                if self.on_evict is not None:
+                    self.on_evict(evicted_id, evicted_entry.reloader.current)
+
+            if self.hot_reload:
+                reloader.ensure_started()
+            return serving_model
+
+    def memory_bytes(self):
+        return sum(entry.memory_bytes for entry in self.entries.values())
+
+    def evict(self, keep):
+        # called with self.lock held, least recently used first, pinned models and the new model stay
+        evicted = []
+        for model_id in list(self.entries):
+            too_many = len(self.entries) > self.max_models
+            too_big = self.max_memory_bytes is not None and self.memory_bytes() > self.max_memory_bytes
+            if not (too_many or too_big):
+                break
+            entry = self.entries[model_id]
+            if entry.pinned or model_id == keep:
+                continue
+            del self.entries[model_id]
+            self.counters(model_id)["evictions"] += 1
+            evicted.append((model_id, entry))
+
+        if len(self.entries) > self.max_models or (self.max_memory_bytes is not None and self.memory_bytes() > self.max_memory_bytes):
+            logger.warning(f"Model registry is over its limits with {len(self.entries)} models "
+                           f"({self.memory_bytes() / MB:.1f} MB), only pinned / in use models are left")
+        return evicted
+
+    def loaded_models(self):
+        # (model id, active ServingModel) of every loaded model
+        with self.lock:
+            return [(model_id, entry.reloader.current) for model_id, entry in self.entries.items()]
+
+    def loaded_model_ids(self):
+        with self.lock:
+            return list(self.entries)
+
+    def reloader(self, model_id):
+        # the ModelReloader of a loaded model (for /admin/model), None when it is not loaded
+        with self.lock:
+            entry = self.entries.get(model_id)
+        return entry.reloader if entry is not None else None
+
+    def stats(self):
+        with self.lock:
+            loaded = {
+                model_id: {
+                    **entry.reloader.current.describe(),
+                    "pinned": entry.pinned,
+                    "memory_mb": round(entry.memory_bytes / MB, 3),
+                    "load_seconds": round(entry.load_seconds, 4),
+                    "hits_since_load": entry.hits,
+                    "idle_seconds": round(time.time() - entry.last_used, 1)
+                }
+                for model_id, entry in self.entries.items()
+            }
+            models = {model_id: {**stats, "total_load_seconds": round(stats["total_load_seconds"], 4), "loaded": model_id in loaded}
+                      for model_id, stats in self.model_stats.items()}
+            memory = self.memory_bytes()
+
+        return {
+            "max_models": self.max_models,
+            "max_memory_mb": self.max_memory_bytes / MB if self.max_memory_bytes is not None else None,
+            "loaded_models": len(loaded),
+            "memory_mb": round(memory / MB, 3),
+            "loaded": loaded,
+            "models": models
+        }
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from datetime import datetime
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The serving process used to load the model once at import, a newly trained model meant a restart
+# (in flight requests dropped + cold start again). The model reloader instead:
+#   - polls the model file in a background thread (mtime + size, cheap even for a large pickle)
+#   - waits until the file has the same version on 2 polls in a row, so a file which is still being
+#     written by ModelTraining.save_model is never loaded half way
+#   - loads AND warms up the new model in that background thread, the request threads keep using the old one
+#   - swaps it in with a single assignment of self.current (atomic in python). A request reads
+#     reloader.current once at its start, so requests which already started finish on the old model
+# A model which fails to load is logged and skipped, the old model stays active.
+
+def file_version(file_path):
+    # cheap version of a model file -> modification time + size, no need to hash a large pickle
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+class ServingModel:
+    # everything one model version needs to answer requests, swapped together so a request never
+    # mixes the feature columns / preprocessor of one training run with the model of another
+    def __init__(self, model, feature_columns, version, model_path, preprocessor=None, micro_batcher=None, model_id=None,
+                 drift_monitor=None):
+        self.model_id = model_id
+        self.drift_monitor = drift_monitor
+        self.model = model
+        self.feature_columns = feature_columns
+        self.version = version
+        self.model_path = model_path
+        self.preprocessor = preprocessor
+        self.micro_batcher = micro_batcher
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+
+    def describe(self):
+        return {
+            "model_id": self.model_id,
+            "version": self.version,
+            "model_path": self.model_path,
+            "model": type(self.model).__name__,
+            "n_features": len(self.feature_columns),
+            "feature_columns": self.feature_columns,
+            "preprocessor": self.preprocessor is not None,
+            "drift_monitor": self.drift_monitor is not None,
+            "loaded_at": self.loaded_at
+        }
+
+
+class ModelReloader:
+
+    def __init__(self, load_fn, watch_path, poll_seconds=5.0, on_swap=None):
+        # load_fn  - function(model_path, version) -> warmed up ServingModel
+        # on_swap  - optional function(old, new) called after the new model is active
+        self.load_fn = load_fn
+        self.watch_path = watch_path
+        self.poll_seconds = poll_seconds
+        self.on_swap = on_swap
+
+        self.reload_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.pid = None
+
+        self.n_reloads = 0
+        self.n_failures = 0
+        self.last_error = None
+        self.last_failed_version = None
+        self.pending_version = None
+
+        # the first model is loaded synchronously, the app cannot answer anything without it
+        self.current = load_fn(watch_path, file_version(watch_path))
+
+    def ensure_started(self):
+        # the watcher thread is started on the first request and not at import: with gunicorn's preload_app
+        # the import happens in the master process, threads do not survive the fork and the master never
+        # serves requests. Every worker process starts its own watcher instead
+        if self.pid != os.getpid() and not self.stopped.is_set():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self.watcher = threading.Thread(target=self._watch, name="model-reloader", daemon=True)
+                    self.watcher.start()
+                    logger.info(f"Model reloader watching {self.watch_path} every {self.poll_seconds}s in process {self.pid}")
+
+    def _watch(self):
+        while not self.stopped.wait(self.poll_seconds):
+            try:
+                self.check(wait_until_stable=True)
+            except Exception as e:
+                # never let the watcher thread die, the next poll tries again
+                logger.error(f"Model reloader check failed - {e}")
+
+    def check(self, wait_until_stable=False):
+        # returns True when a new model was swapped in
+        with self.reload_lock:
+            try:
+                version = file_version(self.watch_path)
+            except OSError:
+                # the file is being replaced right now
+                return False
+
+            if version == self.current.version or version == self.last_failed_version:
+                self.pending_version = None
+                return False
+
+            if wait_until_stable and version != self.pending_version:
+                self.pending_version = version
+                return False
+
+            logger.info(f"Model file {self.watch_path} changed ({self.current.version} -> {version}), loading the new model")
+            started = time.perf_counter()
+            try:
+                new_model = self.load_fn(self.watch_path, version)
+            except Exception as e:
+                self.n_failures += 1
+                self.last_error = str(e)
+                self.last_failed_version = version
+                logger.error(f"Failed to load model version {version}, keeping version {self.current.version} - {e}")
+                return False
+
+            old_model = self.current
+            self.current = new_model
+            self.n_reloads += 1
+            self.pending_version = None
+            logger.info(f"Model version {version} is active, loaded and warmed up in {time.perf_counter() - started:.2f}s")
+
+            if self.on_swap is not None:
+                self.on_swap(old_model, new_model)
+            return True
+
+    def stop(self):
+        # e.g. the model was evicted from the model registry, its watcher thread ends after the current poll
+        self.stopped.set()
+
+    def status(self):
+        return {
+            **self.current.describe(),
+            "watching": self.pid == os.getpid(),
+            "poll_seconds": self.poll_seconds,
+            "reloads": self.n_reloads,
+            "failures": self.n_failures,
+            "last_error": self.last_error
+        }
@@ -1,11 +1,18 @@
 import os
+import time
+import numpy as np
 import pandas as pd
 import joblib
-from sklearn.model_selection import RandomizedSearchCV
+from joblib import Parallel, delayed
+from sklearn.model_selection import RandomizedSearchCV, ParameterSampler, StratifiedKFold
+from sklearn.base import clone
 import lightgbm as lgb
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
 from src.logger import get_logger
 from src.custom_exception import CustomException
+from src.fast_predictor import compile_lightgbm_model, save_compiled_model, FastPredictor
+from src.instrumentation import instrumented, instrument, record, log_steps_to_mlflow
+from src.task_graph import TaskGraph
 from config.paths import *
 from config.model_params import *
 from utils.common_functions import yaml_file_reader, load_data
@@ -16,17 +23,40 @@ import mlflow.sklearn
 
 logger = get_logger(__name__)
 
+# scoring names from HALVING_SEARCH_PARAMS -> metric on the predicted probabilities of a validation fold
+SCORING_FUNCTIONS = {
+    "accuracy": lambda y, proba: accuracy_score(y, proba > 0.5),
+    "precision": lambda y, proba: precision_score(y, proba > 0.5),
+    "recall": lambda y, proba: recall_score(y, proba > 0.5),
+    "f1": lambda y, proba: f1_score(y, proba > 0.5),
+    "roc_auc": roc_auc_score
+}
+
 class ModelTraining:
     
     def __init__(self, train_path, test_path, model_save_path):
         self.train_path = train_path
         self.test_path = test_path
         self.model_save_path = model_save_path
+        # numpy only copy of the trees for serving, next to the pickled model -> lgbm_model.npz
+        self.compiled_model_path = os.path.splitext(model_save_path)[0] + ".npz"
 
         # here we are also initializing our lighgbm params and random search params
         self.params_dist = LIGHGBM_PARAMS
         self.random_search_params = RANDOM_SEARCH_PARAMS
+        self.search_mode = SEARCH_MODE
+        self.halving_search_params = HALVING_SEARCH_PARAMS
+
+        # when DataProcessor balanced with class weights instead of SMOTE, the model has to weight the classes
+        preprocessing_config = yaml_file_reader(CONFIG_PATH)["data_preprocessing"]
+        self.class_weight = "balanced" if preprocessing_config["balancing"]["method"] == "class_weight" else None
+
+        # categorical_mode native -> the label encoded columns are given to lightgbm as categorical features,
+        # so it splits on groups of categories instead of treating the codes as numbers
+        self.native_categorical = preprocessing_config["categorical_mode"] == "native"
+        self.categorical_columns = preprocessing_config["categorical_columns"]
 
+    @instrumented("ModelTraining.load_split_data", rows=lambda split: len(split[0]) + len(split[2]))
     def load_split_data(self):
         
         try:
@@ -49,12 +79,33 @@ class ModelTraining:
             raise CustomException("Failed to load data", e)
         
 
+    @staticmethod
+    def split_cores(n_jobs, lgbm_threads):
+        # how many fits run in parallel, so that parallel fits x lightgbm threads = available cores
+        # (n_jobs=-1 with lightgbm's default of all cores per fit would start cores x cores threads)
+        n_cores = os.cpu_count() or 1
+        total = n_cores if n_jobs is None or n_jobs < 0 else n_jobs
+        return max(1, total // lgbm_threads)
+
+    def categorical_features(self, X_train):
+        # the categorical columns which survived feature selection, "auto" -> lightgbm's default (none for our int codes)
+        if not self.native_categorical:
+            return "auto"
+        return [col for col in X_train.columns if col in self.categorical_columns]
+
+    @instrumented("ModelTraining.train_lgbm")
     def train_lgbm(self, X_train, y_train):
+        if self.search_mode == "halving":
+            return self.train_lgbm_halving(X_train, y_train)
 
         try:
             logger.info("Initializing the model")
 
-            lgbm_model = lgb.LGBMClassifier(random_state=self.random_search_params["random_state"])
+            # one lightgbm thread per candidate, RandomizedSearchCV already runs the candidates on all cores
+            lgbm_threads = 1 if self.random_search_params["n_jobs"] != 1 else None
+            lgbm_model = lgb.LGBMClassifier(
+                random_state=self.random_search_params["random_state"], n_jobs=lgbm_threads, class_weight=self.class_weight
+            )
             logger.info("Starting Hyper Parameter Fine-Tuning")
             
             random_search = RandomizedSearchCV(
@@ -69,11 +120,17 @@ class ModelTraining:
             )
 
             logger.info("Starting Hyper Parameter Fine-Tuning")
-            random_search.fit(X_train, y_train)
+            random_search.fit(X_train, y_train, categorical_feature=self.categorical_features(X_train))
 
             logger.info("Hyper Parameter Fine-Tuning Completed")
+            # fit time of every candidate over all its folds, as one step record per candidate
+            for fit_time in random_search.cv_results_["mean_fit_time"]:
+                record("ModelTraining.search_candidate", fit_time * self.random_search_params["cv"], rows=len(X_train), quiet=True)
+
             best_params = random_search.best_params_
             best_model = random_search.best_estimator_
+            # back to lightgbm's default threading for predictions
+            best_model.set_params(n_jobs=None)
 
             logger.info(f"Best Params are: {best_params}")
             logger.info(f"Best Model is: {best_model}")
@@ -85,6 +142,121 @@ class ModelTraining:
             raise CustomException("Failed to train the model", e)
         
 
+    @staticmethod
+    def build_fold_datasets(X_train, y_train, folds, categorical_features="auto"):
+        # Every candidate x fold fit used to get pandas frames -> lightgbm converted them to numpy and
+        # binned every feature (histogram bins) again, the same work 50+ times on the same data.
+        # Here the data is converted to one contiguous float32 matrix and binned ONCE into a lightgbm Dataset.
+        # The folds are subsets of that Dataset, they reuse its bins, and are shared by all candidates and rungs.
+        X = np.ascontiguousarray(X_train.to_numpy(dtype=np.float32))
+        y = y_train.to_numpy()
+
+        full_dataset = lgb.Dataset(
+            X, label=y, feature_name=list(X_train.columns), categorical_feature=categorical_features,
+            free_raw_data=False, params={"verbose": -1}
+        )
+        full_dataset.construct()
+
+        fold_datasets = []
+        for train_idx, val_idx in folds:
+            train_dataset = full_dataset.subset(np.sort(train_idx)).construct()
+            val_dataset = full_dataset.subset(np.sort(val_idx)).construct()
+            fold_datasets.append((train_dataset, val_dataset, X[np.sort(val_idx)], y[np.sort(val_idx)]))
+
+        return fold_datasets
+
+    @staticmethod
+    def fit_fold(params, fold_dataset, rounds, early_stopping_rounds, scoring):
+        # one candidate on one fold for at most `rounds` boosting rounds
+        # early stopping on the validation fold ends bad or converged candidates before `rounds`
+        train_dataset, val_dataset, X_val, y_val = fold_dataset
+        start = time.perf_counter()
+        booster = lgb.train(
+            {key: value for key, value in params.items() if key != "n_estimators"},
+            train_dataset,
+            num_boost_round=min(rounds, params["n_estimators"]),
+            valid_sets=[val_dataset],
+            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)]
+        )
+        best_iteration = booster.best_iteration or booster.current_iteration()
+        probabilities = booster.predict(X_val, num_iteration=best_iteration)
+        return SCORING_FUNCTIONS[scoring](y_val, probabilities), best_iteration, time.perf_counter() - start
+
+    def train_lgbm_halving(self, X_train, y_train):
+
+        try:
+            params = self.halving_search_params
+            n_parallel = self.split_cores(params["n_jobs"], params["lgbm_threads"])
+            logger.info(f"Starting Successive Halving search with {params['n_candidates']} candidates, "
+                        f"{n_parallel} parallel fits x {params['lgbm_threads']} lightgbm threads")
+
+            base_model = lgb.LGBMClassifier(
+                random_state=params["random_state"], n_jobs=params["lgbm_threads"], verbose=-1, class_weight=self.class_weight
+            )
+            # same settings as base_model, with lightgbm's native names for lgb.train
+            # (is_unbalance is lightgbm's native version of class_weight="balanced" for binary targets)
+            native_params = {
+                "objective": "binary", "seed": params["random_state"], "num_threads": params["lgbm_threads"], "verbose": -1,
+                "is_unbalance": self.class_weight == "balanced"
+            }
+
+            candidates = list(ParameterSampler(self.params_dist, n_iter=params["n_candidates"], random_state=params["random_state"]))
+            folds = list(StratifiedKFold(n_splits=params["cv"], shuffle=True, random_state=params["random_state"]).split(X_train, y_train))
+
+            logger.info("Binning the training data once for all folds and candidates")
+            fold_datasets = self.build_fold_datasets(X_train, y_train, folds, self.categorical_features(X_train))
+
+            rounds = params["min_rounds"]
+            with Parallel(n_jobs=n_parallel, prefer="threads") as parallel:
+                while True:
+                    # every surviving candidate on every fold with the same budget of boosting rounds
+                    with instrument(f"ModelTraining.halving_rung_{rounds}_rounds") as rung:
+                        results = parallel(
+                            delayed(self.fit_fold)(
+                                {**native_params, **candidate}, fold_dataset, rounds, params["early_stopping_rounds"], params["scoring"]
+                            )
+                            for candidate in candidates for fold_dataset in fold_datasets
+                        )
+                        rung.rows = len(candidates)
+                    results = np.array(results).reshape(len(candidates), len(fold_datasets), 3)
+                    scores = results[:, :, 0].mean(axis=1)
+                    best_iterations = results[:, :, 1].mean(axis=1)
+                    # fit time of every candidate over all its folds (summed, the folds may run in parallel)
+                    for fit_time in results[:, :, 2].sum(axis=1):
+                        record("ModelTraining.search_candidate", fit_time, rows=len(X_train), quiet=True)
+
+                    logger.info(f"Rung with {rounds} rounds - {len(candidates)} candidates, best score {scores.max():.4f}")
+
+                    if len(candidates) <= 1 or rounds >= params["max_rounds"]:
+                        break
+
+                    # keep the best 1/factor candidates and give them factor x more rounds
+                    n_keep = max(1, len(candidates) // params["factor"])
+                    keep = np.argsort(scores)[::-1][:n_keep]
+                    candidates = [candidates[i] for i in keep]
+                    rounds = min(rounds * params["factor"], params["max_rounds"])
+
+            best = int(np.argmax(scores))
+            # refit on all the training data with the number of rounds early stopping found on the folds
+            best_params = {**candidates[best], "n_estimators": max(1, int(round(best_iterations[best])))}
+            logger.info(f"Best Params are: {best_params}")
+
+            best_model = clone(base_model).set_params(**best_params)
+            best_model.fit(X_train, y_train, categorical_feature=self.categorical_features(X_train))
+            # back to lightgbm's default threading for predictions
+            best_model.set_params(n_jobs=None)
+
+            logger.info("Hyper Parameter Fine-Tuning Completed")
+            logger.info(f"Best Model is: {best_model}")
+
+            return best_model
+
+        except Exception as e:
+            logger.error(f"Error while training the model with successive halving - {e}")
+            raise CustomException("Failed to train the model", e)
+        
+
+    @instrumented("ModelTraining.evaluate_model")
     def evaluate_model(self, model, X_test, y_test):
 
         try:
@@ -112,6 +284,7 @@ class ModelTraining:
             logger.error(f"Error while evaluating the model - {e}")
             raise CustomException("Failed to evaluating the model", e)
 
+    @instrumented("ModelTraining.save_model")
     def save_model(self, model):
 
         try:
@@ -126,6 +299,32 @@ class ModelTraining:
             logger.error(f"Error while Saving the model - {e}")
             raise CustomException("Failed to Saving the model", e)
         
+    @instrumented("ModelTraining.export_compiled_model")
+    def export_compiled_model(self, model, X_test):
+        # flatten the trees into numpy arrays for the flask app (src/fast_predictor.py)
+        # and make sure the compiled model gives the same probabilities as lightgbm before saving it
+        try:
+            logger.info("Compiling the model for serving")
+            compiled = compile_lightgbm_model(model)
+
+            X_check = X_test.to_numpy(dtype="float32")
+            difference = abs(FastPredictor(compiled).predict_proba(X_check) - model.predict_proba(X_check)).max()
+            if difference > 1e-9:
+                raise ValueError(f"Compiled model differs from lightgbm by {difference}")
+
+            save_compiled_model(compiled, self.compiled_model_path)
+            logger.info(f"Compiled Model Saved to {self.compiled_model_path} (max difference {difference:.1e})")
+
+        except Exception as e:
+            logger.error(f"Error while compiling the model - {e}")
+            raise CustomException("Failed to compile the model", e)
+
+    @staticmethod
+    def log_artifacts(client, run_id, paths, artifact_path=None):
+        for path in paths:
+            logger.info(f"Logging {path} to MLFLOW")
+            client.log_artifact(run_id, path, artifact_path)
+
     def run(self):
 
         try:
@@ -135,27 +334,51 @@ class ModelTraining:
 
 
                 logger.info("Starting MLFLOW Experimentation")
+                # incremental training compares itself with the latest run which has this tag
+                mlflow.set_tag("training_mode", "full")
+                # timings of the steps which ran before this mlflow run started (ingestion, processing),
+                # every step from here on is logged to the run as soon as it finishes
+                log_steps_to_mlflow()
 
 
                 logger.info("Starting our model training pipeline.")
 
+                # the mlflow run of the fluent api (mlflow.log_artifact ...) only exists on this thread,
+                # the upload tasks log to it through the client with its run id
+                client = mlflow.MlflowClient()
+                run_id = mlflow.active_run().info.run_id
+
+                # the steps as a graph of tasks (src/task_graph.py), the uploads to mlflow do not block training:
+                #   log_datasets                                  (runs next to loading + training)
+                #   load_split -> train -> evaluate
+                #                       -> save_model -> log_model           (next to evaluate / export)
+                #                       -> export_compiled -> log_compiled_model
+                graph = TaskGraph.from_config("ModelTraining.run", yaml_file_reader(CONFIG_PATH))
+
                 # First we want to log our the dataset - Which dataset was used to train the model
                 # Later we could see that, this data was trained to get this version of the model
                 # example - we got version 1 model by using 1000 rows of data
-                logger.info("Logging the Training and Testing Dataset to MLFLOW")
-                mlflow.log_artifact(local_path=self.train_path, artifact_path="datasets")
-                mlflow.log_artifact(local_path=self.test_path,artifact_path="datasets")
-
+                graph.add("log_datasets", lambda: self.log_artifacts(client, run_id, [self.train_path, self.test_path], "datasets"))
 
                 # first we will proceed with the load and split
-                X_train, y_train, X_test, y_test = self.load_split_data()
-                best_lgbm_model = self.train_lgbm(X_train, y_train)
-                model_evaluation_metrics = self.evaluate_model(best_lgbm_model, X_test, y_test)
-                self.save_model(best_lgbm_model)
-
-                # after we save the model, we want to log the model and metrics also in mlflow
-                logger.info("Logging the model into MLFLOW")
-                mlflow.log_artifact(self.model_save_path)
+                graph.add("load_split", self.load_split_data, outputs=["X_train", "y_train", "X_test", "y_test"])
+                graph.add("train", self.train_lgbm, inputs=["X_train", "y_train"], outputs=["model"])
+                graph.add("evaluate", self.evaluate_model, inputs=["model", "X_test", "y_test"], outputs=["metrics"])
+                graph.add("save_model", lambda model: self.save_model(model) or self.model_save_path,
+                          inputs=["model"], outputs=["model_file"])
+                graph.add("export_compiled", lambda model, X_test: self.export_compiled_model(model, X_test) or self.compiled_model_path,
+                          inputs=["model", "X_test"], outputs=["compiled_file"])
+
+                # after we save the model, we want to log the model also in mlflow
+                graph.add("log_model", lambda path: self.log_artifacts(client, run_id, [path]), inputs=["model_file"])
+                graph.add("log_compiled_model", lambda path: self.log_artifacts(client, run_id, [path]), inputs=["compiled_file"])
+
+                values = graph.run()
+                best_lgbm_model = values["model"]
+                model_evaluation_metrics = values["metrics"]
+                # steps which finished on the worker threads did not see the active run
+                log_steps_to_mlflow()
+
                 logger.info("Logging the Params into MLFLOW")
                 mlflow.log_params(params= best_lgbm_model.get_params())
                 logger.info("Logging the Metrics into MLFLOW")
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The same booking is often scored many times (the booking page is refreshed, a retry after a timeout,
+# the batch job re-sends yesterday's rows). The prediction cache keeps the probabilities of recently
+# scored rows in memory so a repeated row skips the model completely.
+#   - key   -> model version + the bytes of the float32 feature row (the exact matrix the model sees,
+#              so 10 and 10.0 for lead_time are the same booking)
+#   - LRU   -> an OrderedDict, the least recently used row is dropped once max_size rows are cached
+#   - TTL   -> every row expires ttl_seconds after it was scored
+#   - every lookup passes the version of the model which is answering it. When a new version shows up
+#     (the model file was replaced and the model reloader swapped it in) the whole cache is cleared and the
+#     old version is retired. Versions only move forward: requests still finishing on a retired model
+#     neither read nor store anything, so they can not flip the cache back to the old model
+
+class PredictionCache:
+
+    def __init__(self, max_size=100000, ttl_seconds=3600):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.model_version = None
+        # versions the cache moved away from, one per hot reload
+        self.retired_versions = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        logger.info(f"Prediction cache enabled with max_size={max_size} and ttl_seconds={ttl_seconds}")
+
+    @staticmethod
+    def row_key(row):
+        return np.ascontiguousarray(row, dtype=np.float32).tobytes()
+
+    def _check_version(self, model_version):
+        # called with the lock held, False -> the version is retired and the cache must not be used
+        if model_version == self.model_version:
+            return True
+        if model_version in self.retired_versions:
+            return False
+        if self.model_version is not None:
+            logger.info(f"Model version changed ({self.model_version} -> {model_version}), clearing {len(self.entries)} cached predictions")
+            self.invalidations += 1
+            self.retired_versions.add(self.model_version)
+        self.entries.clear()
+        self.model_version = model_version
+        return True
+
+    def get_many(self, features, model_version):
+        # returns one cached output row (or None) per row of the feature matrix
+        row_keys = [self.row_key(row) for row in features]
+        results = []
+
+        with self.lock:
+            if not self._check_version(model_version):
+                return [None] * len(row_keys)
+            now = time.monotonic()
+
+            for key in row_keys:
+                entry = self.entries.get(key)
+
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                value, expires_at = entry
+                if expires_at < now:
+                    del self.entries[key]
+                    self.expirations += 1
+                    self.misses += 1
+                    results.append(None)
+                    continue
+
+                self.entries.move_to_end(key)
+                self.hits += 1
+                results.append(value)
+
+        return results
+
+    def put_many(self, features, outputs, model_version):
+        with self.lock:
+            if not self._check_version(model_version):
+                # scored by a model which is not the active one anymore
+                return
+
+            expires_at = time.monotonic() + self.ttl
+            for row, value in zip(features, outputs):
+                key = self.row_key(row)
+                self.entries[key] = (np.array(value, copy=True), expires_at)
+                self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, row, model_version):
+        return self.get_many([row], model_version)[0]
+
+    def put(self, row, value, model_version):
+        self.put_many([row], [value], model_version)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
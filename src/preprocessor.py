@@ -0,0 +1,135 @@
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+# bump this whenever the saved fields below change, so an old artifact is not silently misread
+PREPROCESSOR_VERSION = 1
+
+# The preprocessor keeps everything DataProcessor learns from the TRAIN split:
+#   - the classes of every categorical column (same codes as sklearn LabelEncoder, classes are sorted)
+#   - which numerical columns were skewed enough to get log1p
+#   - the features kept by feature selection, in the order the model expects them
+# It is fitted once during training, saved next to the model and loaded again by the flask app,
+# so train, test and live bookings all go through exactly the same transformation.
+
+class Preprocessor:
+
+    def __init__(self, categorical_columns, numerical_columns, skewness_threshold):
+        self.categorical_columns = list(categorical_columns)
+        self.numerical_columns = list(numerical_columns)
+        self.skewness_threshold = skewness_threshold
+
+        # these get filled by fit() and by DataProcessor after feature selection
+        self.classes = {}
+        self.skewed_columns = []
+        self.selected_features = None
+        self.target_column = "booking_status"
+
+    def fit(self, df):
+        try:
+            logger.info("Fitting preprocessor on training data")
+
+            for col in self.categorical_columns:
+                self.classes[col] = np.unique(df[col].astype(str)).tolist()
+                logger.info(f"{col}: {dict(zip(self.classes[col], range(len(self.classes[col]))))}")
+
+            skewness = df[self.numerical_columns].skew()
+            self.skewed_columns = skewness[skewness > self.skewness_threshold].index.tolist()
+            logger.info(f"Skewed columns which will get log1p - {self.skewed_columns}")
+
+            return self
+
+        except Exception as e:
+            logger.error(f"Error while fitting the preprocessor {e}")
+            raise CustomException("Failed to fit the preprocessor", e)
+
+    def transform(self, df):
+        # vectorized -> one pandas call per column, no python loop over rows
+        # columns which are not in df (e.g. booking_status for live bookings) are skipped
+        # once selected_features is set only those features (+ target if present) are returned
+        try:
+            df = df.copy()
+
+            for col, classes in self.classes.items():
+                if col not in df.columns:
+                    continue
+                codes = pd.Categorical(df[col].astype(str), categories=classes).codes
+                n_unseen = int((codes == -1).sum())
+                if n_unseen:
+                    # category never seen in training -> code -1, the trees treat it as a value below every split
+                    logger.warning(f"{n_unseen} rows have unseen categories in {col}")
+                df[col] = codes.astype(np.int64)
+
+            for col in self.skewed_columns:
+                if col in df.columns:
+                    df[col] = np.log1p(df[col].astype(np.float64))
+
+            if self.selected_features is not None:
+                columns = list(self.selected_features)
+                if self.target_column in df.columns:
+                    columns.append(self.target_column)
+                df = df[columns]
+
+            return df
+
+        except KeyError as e:
+            logger.error(f"Missing columns while transforming {e}")
+            raise CustomException(f"Input is missing columns required by the preprocessor - {e}", e)
+        except Exception as e:
+            logger.error(f"Error while transforming data {e}")
+            raise CustomException("Failed to transform data with the preprocessor", e)
+
+    def to_matrix(self, df):
+        # transform raw bookings and return the contiguous float32 matrix the model expects
+        if self.selected_features is None:
+            raise ValueError("Preprocessor has no selected features, run DataProcessor first")
+        df = self.transform(df)
+        return np.ascontiguousarray(df[self.selected_features].to_numpy(dtype=np.float32))
+
+    def save(self, file_path):
+        try:
+            artifact = {
+                "version": PREPROCESSOR_VERSION,
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "categorical_columns": self.categorical_columns,
+                "numerical_columns": self.numerical_columns,
+                "skewness_threshold": self.skewness_threshold,
+                "classes": self.classes,
+                "skewed_columns": self.skewed_columns,
+                "selected_features": self.selected_features,
+                "target_column": self.target_column
+            }
+            # DataProcessor runs before ModelTraining creates artifacts/models
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            joblib.dump(artifact, file_path)
+            logger.info(f"Preprocessor saved to {file_path}")
+
+        except Exception as e:
+            logger.error(f"Error while saving the preprocessor {e}")
+            raise CustomException("Failed to save the preprocessor", e)
+
+    @classmethod
+    def load(cls, file_path):
+        try:
+            artifact = joblib.load(file_path)
+            if artifact.get("version") != PREPROCESSOR_VERSION:
+                raise ValueError(f"Preprocessor version {artifact.get('version')} is not supported, expected {PREPROCESSOR_VERSION}")
+
+            preprocessor = cls(artifact["categorical_columns"], artifact["numerical_columns"], artifact["skewness_threshold"])
+            preprocessor.classes = artifact["classes"]
+            preprocessor.skewed_columns = artifact["skewed_columns"]
+            preprocessor.selected_features = artifact["selected_features"]
+            preprocessor.target_column = artifact["target_column"]
+
+            logger.info(f"Preprocessor loaded from {file_path} (created at {artifact['created_at']})")
+            return preprocessor
+
+        except Exception as e:
+            logger.error(f"Error while loading the preprocessor {e}")
+            raise CustomException("Failed to load the preprocessor", e)
@@ -0,0 +1,156 @@
+import os
+import threading
+from bisect import bisect_left
+
+# Prometheus style metrics for the flask app, served as text on /metrics.
+#   - Counter   -> only goes up (errors)
+#   - Histogram -> counts of observations per bucket + their sum (latencies, batch sizes)
+#   - Gauge     -> a value computed by a callback when /metrics is scraped (drift scores), nothing per request
+# Cheap enough to leave on for every request:
+#   - no lock on the hot path. Every thread gets its own preallocated list of bucket counts (a shard),
+#     the first observation of a thread registers its shard once. /metrics adds the shards together
+#   - the buckets are fixed when the metric is created, an observation is one bisect + 3 list updates
+# The numbers are per process. With several gunicorn workers every scrape is answered by one worker,
+# its pid is in the worker label so the series of different workers do not get mixed up.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+class ShardedValues:
+    # one list of size n per thread, summed up only when the metrics are read
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = [0] * self.size
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def totals(self):
+        with self.lock:
+            shards = list(self.shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0] * self.size
+
+
+class CounterChild:
+
+    def __init__(self):
+        self.values = ShardedValues(1)
+
+    def inc(self, amount=1):
+        self.values.shard()[0] += amount
+
+    def samples(self, name, labels):
+        yield f"{name}_total{labels}", self.values.totals()[0]
+
+
+class HistogramChild:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket + the +Inf bucket, then the sum of all observations
+        self.values = ShardedValues(len(buckets) + 2)
+
+    def observe(self, value):
+        shard = self.values.shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def samples(self, name, labels):
+        totals = self.values.totals()
+        cumulative = 0
+        prefix = labels[:-1] + "," if labels else "{"
+        for bound, count in zip(self.buckets + ("+Inf",), totals[:-1]):
+            cumulative += count
+            yield f'{name}_bucket{prefix}le="{bound}"}}', cumulative
+        yield f"{name}_sum{labels}", totals[-1]
+        yield f"{name}_count{labels}", cumulative
+
+
+class Metric:
+
+    def __init__(self, metric_type, name, documentation, label_names, buckets=None):
+        self.metric_type = metric_type
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        # the child of a label combination is created once, after that it is a plain dict lookup
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = CounterChild() if self.metric_type == "counter" else HistogramChild(self.buckets)
+                    self.children[values] = child
+        return child
+
+    def exposition(self, extra_labels):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for values, child in list(self.children.items()):
+            labels = format_labels(extra_labels, self.label_names, values)
+            lines.extend(f"{sample} {value}" for sample, value in child.samples(self.name, labels))
+        return lines
+
+
+class CallbackGauge(Metric):
+
+    def __init__(self, name, documentation, label_names, callback):
+        # callback() -> {label values tuple: value}, called on every scrape
+        super().__init__("gauge", name, documentation, label_names)
+        self.callback = callback
+
+    def exposition(self, extra_labels):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for values, value in self.callback().items():
+            lines.append(f"{self.name}{format_labels(extra_labels, self.label_names, values)} {value}")
+        return lines
+
+
+def format_labels(extra_labels, label_names, values):
+    pairs = [*extra_labels, *zip(label_names, values)]
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}" if pairs else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, label_names=()):
+        metric = Metric("counter", name, documentation, tuple(label_names))
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        metric = Metric("histogram", name, documentation, tuple(label_names), buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, label_names, callback):
+        metric = CallbackGauge(name, documentation, tuple(label_names), callback)
+        self.metrics.append(metric)
+        return metric
+
+    def exposition(self):
+        # prometheus text format 0.0.4
+        extra_labels = [("worker", os.getpid())]
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.exposition(extra_labels))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+from src.logger import get_logger
+from src.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+# The training pipeline has 3 stages and each of them is expensive (download, SMOTE + feature selection,
+# hyper parameter search). Most of the time only one thing changed, e.g. one model param.
+# For every stage we build a fingerprint = sha256 of everything the stage depends on:
+#   - the content of its input files
+#   - the part of config.yaml / model_params.py it reads
+# After a successful run the fingerprint and the hashes of the output files are written to a manifest.
+# Next time, if the fingerprint is the same and the outputs are still there untouched, the stage is skipped.
+
+def file_hash(file_path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _describe(value):
+    # json fallback for things like scipy distributions in model_params.py
+    # randint(100, 500) -> {"dist": "randint", "args": [100, 500], "kwds": {}}
+    if hasattr(value, "dist") and hasattr(value, "args"):
+        return {"dist": value.dist.name, "args": list(value.args), "kwds": value.kwds}
+    return repr(value)
+
+
+class StageCache:
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def manifest_path(self, stage):
+        return os.path.join(self.cache_dir, f"{stage}.json")
+
+    def fingerprint(self, input_files=(), **settings):
+        # settings - config sections / params the stage reads, e.g. config=..., params=...
+        try:
+            sha = hashlib.sha256()
+            for file_path in input_files:
+                sha.update(file_path.encode())
+                sha.update(file_hash(file_path).encode())
+            sha.update(json.dumps(settings, sort_keys=True, default=_describe).encode())
+            return sha.hexdigest()
+
+        except Exception as e:
+            logger.error(f"Error while computing stage fingerprint {e}")
+            raise CustomException("Failed to compute stage fingerprint", e)
+
+    def is_fresh(self, stage, fingerprint, output_files):
+        manifest_path = self.manifest_path(stage)
+        if not os.path.exists(manifest_path):
+            return False
+
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+        if manifest.get("fingerprint") != fingerprint:
+            logger.info(f"Stage {stage} inputs changed since the last run")
+            return False
+
+        for file_path in output_files:
+            if not os.path.exists(file_path) or manifest["outputs"].get(file_path) != file_hash(file_path):
+                logger.info(f"Stage {stage} output {file_path} is missing or was modified")
+                return False
+
+        return True
+
+    def save(self, stage, fingerprint, output_files):
+        try:
+            manifest = {
+                "fingerprint": fingerprint,
+                "outputs": {file_path: file_hash(file_path) for file_path in output_files}
+            }
+            with open(self.manifest_path(stage), "w") as f:
+                json.dump(manifest, f, indent=2)
+            logger.info(f"Stage {stage} fingerprint saved")
+
+        except Exception as e:
+            logger.error(f"Error while saving stage manifest {e}")
+            raise CustomException(f"Failed to save manifest for stage {stage}", e)
+
+    @staticmethod
+    def file_state(file_path):
+        # (modification time, size) or None when the file does not exist
+        if not os.path.exists(file_path):
+            return None
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def run(self, stage, fingerprint, output_files, stage_fn, force=False, may_keep=()):
+        # run stage_fn only when needed, returns True if the stage actually ran
+        # may_keep - outputs the stage can legitimately leave untouched (e.g. raw.csv when the bucket object
+        #            did not change), every other output has to be written again by this run
+        if not force and self.is_fresh(stage, fingerprint, output_files):
+            logger.info(f"Skipping stage {stage}, inputs are unchanged and outputs are cached")
+            return False
+
+        logger.info(f"Running stage {stage}")
+        before = {file_path: self.file_state(file_path) for file_path in output_files}
+        # an exception from the stage goes to the caller, nothing is cached
+        stage_fn()
+
+        missing = [file_path for file_path in output_files if not os.path.exists(file_path)]
+        stale = [
+            file_path for file_path in output_files
+            if file_path not in may_keep and file_path not in missing and self.file_state(file_path) == before[file_path]
+        ]
+        if missing or stale:
+            # old outputs from an earlier run must never be cached under the new fingerprint
+            logger.error(f"Stage {stage} did not produce {missing + stale}, not caching it")
+            raise RuntimeError(f"Stage {stage} finished without writing {missing + stale}")
+
+        self.save(stage, fingerprint, output_files)
+        return True
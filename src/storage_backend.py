@@ -0,0 +1,81 @@
+import os
+import base64
+import hashlib
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+# DataIngestion does not talk to google cloud storage directly anymore, it talks to a "storage backend".
+# Every backend has the same 3 methods:
+#   - metadata(name)                 -> {"generation", "md5", "size"} of the object, used to skip unchanged downloads
+#   - read_range(name, start, end, generation) -> bytes start..end (end inclusive) of that exact object version
+#   - download(name, file_path)      -> whole object into a local file
+# GCSBackend is what we use in production, LocalDirectoryBackend reads a folder on disk and is used
+# for testing the ingestion without a bucket or credentials.
+
+class GCSBackend:
+
+    def __init__(self, bucket_name):
+        # imported here so the local backend works without google-cloud-storage credentials/installed
+        from google.cloud import storage
+
+        # one client for the whole ingestion instead of a new one for every call
+        self.client = storage.Client()
+        self.bucket = self.client.bucket(bucket_name)
+
+    def metadata(self, name):
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(f"{name} not found in bucket {self.bucket.name}")
+        # md5_hash is base64, composite objects do not have one -> None
+        return {"generation": blob.generation, "md5": blob.md5_hash, "size": blob.size}
+
+    def read_range(self, name, start, end, generation=None):
+        # pinning the generation makes sure every chunk comes from the same version of the object
+        blob = self.bucket.blob(name, generation=generation)
+        return blob.download_as_bytes(start=start, end=end)
+
+    def download(self, name, file_path):
+        self.bucket.blob(name).download_to_filename(file_path)
+
+
+class LocalDirectoryBackend:
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def metadata(self, name):
+        path = self._path(name)
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(chunk)
+        stat = os.stat(path)
+        return {
+            "generation": stat.st_mtime_ns,
+            "md5": base64.b64encode(md5.digest()).decode(),
+            "size": stat.st_size
+        }
+
+    def read_range(self, name, start, end, generation=None):
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def download(self, name, file_path):
+        with open(self._path(name), "rb") as src, open(file_path, "wb") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                dst.write(chunk)
+
+
+def get_storage_backend(config):
+    # config - the data_ingestion section of config.yaml
+    backend = config.get("storage_backend", "gcs")
+    if backend == "gcs":
+        return GCSBackend(config["bucket_name"])
+    if backend == "local":
+        return LocalDirectoryBackend(config["local_storage_dir"])
+    raise ValueError(f"Unknown storage backend {backend}, use gcs or local")
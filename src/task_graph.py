@@ -0,0 +1,268 @@
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.logger import get_logger
+from src.custom_exception import CustomException
+from src.instrumentation import record, concurrent_steps
+
+logger = get_logger(__name__)
+
+# A small DAG scheduler for the pipeline. Every task declares the values it reads (inputs) and the values
+# it produces (outputs), the dependencies follow from that: a task starts as soon as every task producing
+# one of its inputs is finished, so independent work (loading both splits, uploads to mlflow next to
+# training ...) runs at the same time.
+#
+#   graph = TaskGraph("processing", max_workers=4)
+#   graph.add("load_train", load_data, inputs=["train_path"], outputs=["train_df"])
+#   graph.add("load_test", load_data, inputs=["test_path"], outputs=["test_df"])
+#   graph.add("merge", merge, inputs=["train_df", "test_df"], outputs=["merged_df"])
+#   values = graph.run(train_path=..., test_path=...)      -> {"train_df": ..., "test_df": ..., "merged_df": ...}
+#
+# The task function is called with its inputs as positional arguments in the declared order. With one
+# output the return value is that output, with several outputs it has to be a tuple in the declared order.
+#
+# executor:
+#   - "thread"  (default) -> pandas / numpy / lightgbm / file and network i/o release the GIL, and the task
+#                            can change the state of its object (e.g. fitting the preprocessor)
+#   - "process" -> for pure python work holding the GIL. Function, inputs and outputs are pickled, so it has
+#                  to be a module level function and changes it makes to objects are NOT seen by the parent
+#
+# After run() the critical path (the chain of dependent tasks with the longest total duration) is logged.
+# It is the lower bound of the wall time no matter how many cores we have, the tasks off the path show how
+# much they could grow (slack) before they slow the run down.
+
+
+def call_with_traceback(fn, *args):
+    # project exceptions (CustomException) can not be pickled back to the parent, send the traceback as text
+    try:
+        return fn(*args)
+    except Exception:
+        raise RuntimeError(traceback.format_exc())
+
+
+class Task:
+
+    def __init__(self, name, fn, inputs=(), outputs=(), executor="thread"):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor {executor} for task {name}")
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.executor = executor
+        # filled by TaskGraph.run, seconds since the start of the run
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+
+class TaskGraph:
+
+    def __init__(self, name, max_workers=None, max_processes=None, concurrent=True):
+        # concurrent=False -> every task runs on the calling thread in dependency order, same as before
+        self.name = name
+        self.max_workers = max_workers
+        self.max_processes = max_processes
+        self.concurrent = concurrent
+        self.tasks = {}
+        self.producers = {}
+
+    @classmethod
+    def from_config(cls, name, config):
+        # config - the whole config.yaml, settings from its pipeline section
+        settings = config.get("pipeline") or {}
+        return cls(
+            name,
+            max_workers=settings.get("max_workers"),
+            max_processes=settings.get("max_processes"),
+            concurrent=settings.get("concurrent", True)
+        )
+
+    def add(self, name, fn, inputs=(), outputs=(), executor="thread"):
+        if name in self.tasks:
+            raise ValueError(f"Task {name} is already in graph {self.name}")
+        task = Task(name, fn, inputs, outputs, executor)
+        for output in task.outputs:
+            if output in self.producers:
+                raise ValueError(f"{output} is produced by both {self.producers[output]} and {name}")
+            self.producers[output] = name
+        self.tasks[name] = task
+        return self
+
+    def dependencies(self, task):
+        return {self.producers[value] for value in task.inputs if value in self.producers}
+
+    def topological_order(self, given):
+        # also checks that every input is given or produced and that there is no cycle
+        for task in self.tasks.values():
+            missing = [value for value in task.inputs if value not in self.producers and value not in given]
+            if missing:
+                raise ValueError(f"Task {task.name} needs {missing}, nothing produces them")
+
+        order, done = [], set()
+        remaining = dict(self.tasks)
+        while remaining:
+            ready = [name for name, task in remaining.items() if self.dependencies(task) <= done]
+            if not ready:
+                raise ValueError(f"Tasks {sorted(remaining)} of graph {self.name} depend on each other")
+            for name in ready:
+                order.append(name)
+                done.add(name)
+                del remaining[name]
+        return order
+
+    def store(self, task, result, values):
+        if len(task.outputs) == 1:
+            values[task.outputs[0]] = result
+        elif task.outputs:
+            values.update(zip(task.outputs, result))
+
+    def timed(self, task, args):
+        # start and end are taken on the worker thread, time spent waiting for a free worker is not counted
+        task.started = time.perf_counter() - self.start
+        try:
+            return task.fn(*args)
+        finally:
+            task.finished = time.perf_counter() - self.start
+
+    def run(self, **given):
+        try:
+            order = self.topological_order(given)
+            self.given = set(given)
+            values = dict(given)
+            self.start = time.perf_counter()
+            logger.info(f"Running graph {self.name} with {len(order)} tasks")
+
+            if self.concurrent:
+                # the tasks share the process wide peak memory counter, it is not reset per step while they run
+                with concurrent_steps():
+                    self.run_concurrent(order, values)
+            else:
+                for name in order:
+                    task = self.tasks[name]
+                    self.store(task, self.timed(task, [values[value] for value in task.inputs]), values)
+
+            self.wall_time = time.perf_counter() - self.start
+            self.log_report()
+            return values
+
+        except Exception as e:
+            logger.error(f"Error while running graph {self.name} - {e}")
+            raise CustomException(f"Failed to run task graph {self.name}", e)
+
+    def run_concurrent(self, order, values):
+        needs_processes = any(task.executor == "process" for task in self.tasks.values())
+        threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        # spawn -> a fresh interpreter, forking a process which already runs threads is not safe
+        processes = ProcessPoolExecutor(
+            max_workers=self.max_processes, mp_context=multiprocessing.get_context("spawn")
+        ) if needs_processes else None
+
+        waiting = list(order)
+        running = {}
+        done = set()
+        try:
+            while waiting or running:
+                # submit everything whose dependencies are finished, in topological order
+                for name in list(waiting):
+                    task = self.tasks[name]
+                    if self.dependencies(task) <= done:
+                        args = [values[value] for value in task.inputs]
+                        if task.executor == "process":
+                            # the clock of the worker process can not be compared, measured from here instead
+                            task.started = time.perf_counter() - self.start
+                            future = processes.submit(call_with_traceback, task.fn, *args)
+                        else:
+                            future = threads.submit(self.timed, task, args)
+                        running[future] = task
+                        waiting.remove(name)
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    if task.executor == "process":
+                        task.finished = time.perf_counter() - self.start
+                    error = future.exception()
+                    if error is not None:
+                        logger.error(f"Task {task.name} failed, waiting for {[t.name for t in running.values()]} to finish")
+                        raise error
+                    self.store(task, future.result(), values)
+                    done.add(task.name)
+        finally:
+            # on a failure the tasks which are already running finish, nothing new is started
+            threads.shutdown(wait=True, cancel_futures=True)
+            if processes is not None:
+                processes.shutdown(wait=True, cancel_futures=True)
+
+    def critical_path(self):
+        # longest chain of dependent tasks by measured duration
+        # finish[t] = duration of t + the longest chain before it
+        order = self.topological_order(self.given)
+        finish, previous = {}, {}
+        for name in order:
+            task = self.tasks[name]
+            before = max(self.dependencies(task), key=lambda dep: finish[dep], default=None)
+            previous[name] = before
+            finish[name] = task.duration + (finish[before] if before else 0.0)
+
+        # longest chain after every task, for the slack
+        after = {}
+        for name in reversed(order):
+            children = [child for child in order if name in self.dependencies(self.tasks[child])]
+            after[name] = max((after[child] + self.tasks[child].duration for child in children), default=0.0)
+
+        last = max(finish, key=finish.get)
+        path = []
+        while last is not None:
+            path.append(last)
+            last = previous[last]
+        length = finish[path[0]]
+        slack = {name: length - finish[name] - after[name] for name in order}
+        return path[::-1], length, slack
+
+    def report(self):
+        path, length, slack = self.critical_path()
+        busy = sum(task.duration for task in self.tasks.values())
+        return {
+            "graph": self.name,
+            "wall_time_s": round(self.wall_time, 4),
+            "critical_path_s": round(length, 4),
+            "task_time_s": round(busy, 4),
+            # average number of tasks running at the same time
+            "parallelism": round(busy / self.wall_time, 2) if self.wall_time else 0.0,
+            "critical_path": path,
+            "tasks": {
+                name: {
+                    "start_s": round(task.started, 4),
+                    "duration_s": round(task.duration, 4),
+                    "slack_s": round(slack[name], 4),
+                    "executor": task.executor if self.concurrent else "inline",
+                }
+                for name, task in self.tasks.items()
+            }
+        }
+
+    def log_report(self):
+        report = self.report()
+        logger.info(
+            f"Graph {self.name} finished in {report['wall_time_s']}s - critical path {report['critical_path_s']}s, "
+            f"{report['task_time_s']}s of task time, parallelism {report['parallelism']}"
+        )
+        # one message for the whole table, the rate limit of the logger counts messages per source line
+        lines = [f"Critical path of {self.name}: {' -> '.join(report['critical_path'])}"]
+        for name, task in sorted(report["tasks"].items(), key=lambda item: item[1]["start_s"]):
+            marker = "*" if name in report["critical_path"] else " "
+            lines.append(
+                f"  {marker} {name:<28} start {task['start_s']:>9.3f}s  duration {task['duration_s']:>9.3f}s  "
+                f"slack {task['slack_s']:>9.3f}s  ({task['executor']})"
+            )
+        logger.info("\n".join(lines))
+        # wall time and critical path also go to the step records (and to mlflow when a run is active)
+        record(f"{self.name}.wall_time", report["wall_time_s"], quiet=True)
+        record(f"{self.name}.critical_path", report["critical_path_s"], quiet=True)
+        self.last_report = report
+        return report
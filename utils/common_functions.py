@@ -26,11 +26,118 @@ def yaml_file_reader(yaml_file_path):
 
 # we will create a new function to load the data. For data preprocessing and model training we 
 # have to load the data and also during model training we have to load the data
+# the reader is picked from the file extension -> .csv, .parquet or .feather
+# columns - optional list of columns to read, parquet and feather only read those columns from disk
+# dtype   - optional {column: dtype}, so csv columns do not have to be guessed by pandas
 
-def load_data(file_path):
+def load_data(file_path, columns=None, dtype=None):
     try:
         logger.info(f"Loading the data from the path-{file_path}")
-        return pd.read_csv(file_path)
+        extension = os.path.splitext(file_path)[1]
+
+        if extension == ".parquet":
+            df = pd.read_parquet(file_path, columns=columns)
+        elif extension == ".feather":
+            df = pd.read_feather(file_path, columns=columns)
+        else:
+            return pd.read_csv(file_path, usecols=columns, dtype=dtype)
+
+        # like read_csv, dtype may name columns which were not selected or are not in the file
+        return df.astype({col: dt for col, dt in dtype.items() if col in df.columns}) if dtype else df
     except Exception as e:
         logger.error("Error occured during loading of the data")
-        raise CustomException(f"Failed to load the data. Error - {e}")
+        raise CustomException(f"Failed to load the data. Error - {e}", e)
+
+# read_in_chunks yields the file as dataframes of at most chunk_rows rows, so a file larger than memory
+# can be processed piece by piece. Same extensions and dtype handling as load_data
+
+def read_in_chunks(file_path, chunk_rows=100000, dtype=None):
+    try:
+        logger.info(f"Reading the data from the path-{file_path} in chunks of {chunk_rows} rows")
+        extension = os.path.splitext(file_path)[1]
+
+        if extension == ".csv":
+            yield from pd.read_csv(file_path, dtype=dtype, chunksize=chunk_rows)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if extension == ".parquet":
+            batches = pq.ParquetFile(file_path).iter_batches(batch_size=chunk_rows)
+        elif extension == ".feather":
+            reader = pa.ipc.open_file(file_path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            raise ValueError(f"Unsupported file extension {extension}, expected .csv, .parquet or .feather")
+
+        for batch in batches:
+            # feather batches are as large as they were written, slice them down to chunk_rows
+            for offset in range(0, batch.num_rows, chunk_rows):
+                df = batch.slice(offset, chunk_rows).to_pandas()
+                yield df.astype({col: dt for col, dt in dtype.items() if col in df.columns}) if dtype else df
+
+    except Exception as e:
+        logger.error("Error occured during reading the data in chunks")
+        raise CustomException(f"Failed to read the data in chunks. Error - {e}", e)
+
+# same idea for saving, the writer is picked from the file extension
+# the index is never written, so we do not get the extra 'Unnamed: 0' column back when reading
+
+def save_data(df, file_path):
+    try:
+        logger.info(f"Saving the data to the path-{file_path}")
+        extension = os.path.splitext(file_path)[1]
+
+        if extension == ".parquet":
+            df.to_parquet(file_path, index=False)
+        elif extension == ".feather":
+            # feather can only store a default 0..n-1 index
+            df.reset_index(drop=True).to_feather(file_path)
+        else:
+            df.to_csv(file_path, index=False)
+    except Exception as e:
+        logger.error("Error occured during saving of the data")
+        raise CustomException(f"Failed to save the data. Error - {e}", e)
+
+# When the data does not fit in memory we can not build one dataframe and call save_data.
+# ChunkWriter appends one dataframe chunk at a time to a file in the same formats as save_data.
+# All chunks must have the same columns and dtypes (the first chunk fixes the schema).
+
+class ChunkWriter:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.extension = os.path.splitext(file_path)[1]
+        self.writer = None
+        self.schema = None
+        self.n_rows = 0
+
+    def write(self, df):
+        try:
+            if self.extension in (".parquet", ".feather"):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+                if self.writer is None:
+                    self.schema = table.schema
+                    if self.extension == ".parquet":
+                        self.writer = pq.ParquetWriter(self.file_path, self.schema)
+                    else:
+                        # feather v2 is the arrow ipc file format, so we can write it batch by batch
+                        self.writer = pa.ipc.new_file(self.file_path, self.schema)
+                self.writer.write_table(table)
+            else:
+                df.to_csv(self.file_path, index=False, mode="w" if self.n_rows == 0 else "a", header=self.n_rows == 0)
+
+            self.n_rows += len(df)
+
+        except Exception as e:
+            logger.error("Error occured during writing a chunk of the data")
+            raise CustomException(f"Failed to write a chunk to {self.file_path}. Error - {e}", e)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        logger.info(f"Wrote {self.n_rows} rows to {self.file_path}")